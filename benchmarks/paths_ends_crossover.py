@@ -0,0 +1,77 @@
+"""
+Times paths_ends with "bfs" and "closure" strategies over growing start sets
+to find the ratio |start nodes| / |graph nodes| where the closure starts to
+win (``BFS_START_RATIO`` in project.task3).
+
+    python -m benchmarks.paths_ends_crossover --nodes 1000
+"""
+
+import argparse
+import random
+import time
+
+import cfpq_data
+
+from project.task3 import paths_ends
+
+STRATEGIES = ("bfs", "closure")
+
+
+def measure(graph, start_nodes, regex, strategy, repeat) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        paths_ends(graph, start_nodes, set(), regex, strategy=strategy)
+        best = min(best, time.perf_counter() - begin)
+    return best
+
+
+def crossover(graph, regex, ratios, repeat) -> float | None:
+    nodes = list(graph.nodes)
+    print(f"{'ratio':>8} {'starts':>8} " + " ".join(f"{s:>10}" for s in STRATEGIES))
+    result = None
+    for ratio in ratios:
+        start_nodes = set(random.sample(nodes, max(1, int(ratio * len(nodes)))))
+        times = {
+            strategy: measure(graph, start_nodes, regex, strategy, repeat)
+            for strategy in STRATEGIES
+        }
+        print(
+            f"{ratio:>8.3f} {len(start_nodes):>8} "
+            + " ".join(f"{times[s]:>10.4f}" for s in STRATEGIES)
+        )
+        if result is None and times["closure"] < times["bfs"]:
+            result = ratio
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--regex", default="a* b*")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--ratios", default="0.01,0.05,0.1,0.2,0.3,0.5,0.75,1.0", type=str
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    ratios = [float(r) for r in args.ratios.split(",")]
+    graphs = {
+        "two cycles": cfpq_data.labeled_two_cycles_graph(
+            args.nodes // 2, args.nodes // 2, labels=("a", "b")
+        ),
+        "scale free": cfpq_data.labeled_scale_free_graph(args.nodes, labels=["a", "b"]),
+        "binomial": cfpq_data.labeled_binomial_graph(
+            args.nodes, 4 / args.nodes, labels=["a", "b"]
+        ),
+    }
+    for name, graph in graphs.items():
+        print(f"{name}: {graph.number_of_nodes()} nodes, regex {args.regex!r}")
+        ratio = crossover(graph, args.regex, ratios, args.repeat)
+        print(f"closure wins from ratio {ratio}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compares compile time of regexes with growing number of label alternatives
+for pyformlang (``Regex(...).to_epsilon_nfa().minimize()``, what
+:func:`project.task2.regex_to_dfa` does on a cache miss) and the native
+Glushkov compiler :func:`project.task3.compile_regex`.
+
+    python -m benchmarks.regex_compile --sizes 10,100,300
+
+pyformlang parses regexes recursively and hits the recursion limit on
+large ones; such sizes are reported as ``failed`` for that compiler.
+"""
+
+import argparse
+import time
+
+from pyformlang.regular_expression import Regex
+
+from project.task3 import compile_regex
+
+
+def make_regex(size: int) -> str:
+    labels = " | ".join(f"l{i}" for i in range(size))
+    return f"(({labels}) l0)* ({labels})"
+
+
+COMPILERS = {
+    "pyformlang": lambda regex: Regex(regex).to_epsilon_nfa().minimize(),
+    "glushkov": lambda regex: compile_regex(regex),
+    "glushkov+min": lambda regex: compile_regex(regex, minimize=True),
+}
+
+
+def measure(compiler, regex, repeat) -> float | None:
+    """Best time of ``repeat`` runs, ``None`` if the compiler gives up on ``regex``."""
+    best = float("inf")
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        try:
+            compiler(regex)
+        except RecursionError:
+            return None
+        best = min(best, time.perf_counter() - begin)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10,30,100,300", type=str)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'labels':>8} " + " ".join(f"{name:>14}" for name in COMPILERS))
+    for size in (int(s) for s in args.sizes.split(",")):
+        regex = make_regex(size)
+        times = [measure(c, regex, args.repeat) for c in COMPILERS.values()]
+        print(
+            f"{size:>8} "
+            + " ".join(
+                "failed".rjust(14) if t is None else f"{t:>14.4f}" for t in times
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
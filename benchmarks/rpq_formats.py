@@ -0,0 +1,233 @@
+"""
+Runs ``paths_ends`` (all-pairs/BFS product) and ``reachability_with_constraints``
+(multi-source BFS) over generated graphs for every matrix format and start set
+size. Both engines search in the format of the graph automaton, as far as
+scipy keeps it for products (``dok``/``lil``/``coo`` products come out as
+CSR); the all-pairs closure runs on CSR or packed bits. Wall time, peak RSS
+and nnz of every case are written to JSON, and compared with a stored
+baseline if one is given.
+
+    python -m benchmarks.rpq_formats --output baseline.json
+    python -m benchmarks.rpq_formats --baseline baseline.json
+
+Every case runs in a forked process that resets its RSS high-water mark
+(Linux ``/proc/self/clear_refs``) before the case, and its peak RSS is that
+mark minus the RSS at the start of the case, so neither the parent process
+nor the other cases are counted. Exits with status 1 if any case is slower
+or bigger than the baseline by more than ``--tolerance``.
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+import cfpq_data
+from scipy.sparse import coo_matrix, csc_matrix, csr_matrix, dok_matrix, lil_matrix
+
+from project.task1 import create_two_cycles_graph
+from project.bitmatrix import BitMatrix
+from project.task2 import graph_to_matrices
+from project.task3 import graph_to_mat, paths_ends, regex_to_mat
+from project.task4 import reachability_with_constraints
+
+# format name -> (matrix_class the automata are built and searched in,
+# matrix_class_id used for kron)
+FORMATS = {
+    "csr": (csr_matrix, "csr"),
+    "csc": (csc_matrix, "csc"),
+    "coo": (coo_matrix, "coo"),
+    "lil": (lil_matrix, "lil"),
+    "dok": (dok_matrix, "dok"),
+    "bits": (BitMatrix, "csr"),
+}
+
+
+def make_graphs(nodes: int, seed: int) -> dict:
+    labels = ("a", "b")
+    return {
+        "two_cycles": create_two_cycles_graph(nodes // 2, nodes - nodes // 2, labels),
+        "scale_free": cfpq_data.labeled_scale_free_graph(
+            nodes, labels=labels, seed=seed
+        ),
+        "binomial": cfpq_data.labeled_binomial_graph(
+            nodes, 2 / nodes, labels=labels, seed=seed
+        ),
+    }
+
+
+def run_paths_ends(graph, starts, regex, matrix_class, matrix_class_id):
+    return len(paths_ends(graph, starts, set(), regex, matrix_class, matrix_class_id))
+
+
+def run_reachability(graph, starts, regex, matrix_class, matrix_class_id):
+    result = reachability_with_constraints(
+        graph_to_mat(graph, starts, set(), matrix_class),
+        regex_to_mat(regex, matrix_class),
+    )
+    return sum(len(ends) for ends in result.values())
+
+
+ENGINES = {"paths_ends": run_paths_ends, "reachability": run_reachability}
+
+
+def case_key(case: dict) -> tuple:
+    return case["engine"], case["graph"], case["format"], case["starts"]
+
+
+def memory_mb(field: str) -> float:
+    """``VmRSS`` (current) or ``VmHWM`` (peak) RSS of this process in megabytes."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    raise KeyError(field)
+
+
+def run_case(engine, graph, starts, regex, matrix_format, repeat, queue):
+    matrix_class, matrix_class_id = FORMATS[matrix_format]
+    # a forked child starts with the high-water mark of its parent
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    start_rss = memory_mb("VmRSS")
+    best = float("inf")
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        result_size = ENGINES[engine](
+            graph, starts, regex, matrix_class, matrix_class_id
+        )
+        best = min(best, time.perf_counter() - begin)
+    peak_rss = memory_mb("VmHWM") - start_rss
+    queue.put((best, peak_rss, result_size))
+
+
+def run_all(args) -> list[dict]:
+    random.seed(args.seed)
+    context = multiprocessing.get_context("fork")
+    results = []
+    for graph_name, graph in make_graphs(args.nodes, args.seed).items():
+        graph = graph_to_matrices(graph)
+        nodes = graph.nodes.tolist()
+        for count in args.starts:
+            starts = set(random.sample(nodes, min(count, len(nodes))))
+            for engine in args.engines:
+                for matrix_format in args.formats:
+                    queue = context.Queue()
+                    process = context.Process(
+                        target=run_case,
+                        args=(
+                            engine,
+                            graph,
+                            starts,
+                            args.regex,
+                            matrix_format,
+                            args.repeat,
+                            queue,
+                        ),
+                    )
+                    process.start()
+                    elapsed, peak_rss, result_size = queue.get()
+                    process.join()
+                    case = {
+                        "engine": engine,
+                        "graph": graph_name,
+                        "format": matrix_format,
+                        "starts": len(starts),
+                        "time": elapsed,
+                        "peak_rss_mb": peak_rss,
+                        "graph_nnz": graph.number_of_edges(),
+                        "result_size": result_size,
+                    }
+                    print(
+                        f"{engine:>12} {graph_name:>10} {matrix_format:>4} "
+                        f"{len(starts):>6} {elapsed:>10.4f}s {peak_rss:>8.1f}MB "
+                        f"{result_size:>8}"
+                    )
+                    results.append(case)
+    return results
+
+
+def regressions(
+    results, baseline, tolerance: float, min_time: float, min_rss: float
+) -> list[str]:
+    old = {case_key(case): case for case in baseline}
+    found = []
+    for case in results:
+        before = old.get(case_key(case))
+        if before is None:
+            continue
+        if case["result_size"] != before["result_size"]:
+            found.append(
+                f"{case_key(case)}: result size {before['result_size']} -> "
+                f"{case['result_size']}"
+            )
+        if (
+            case["time"] > before["time"] * (1 + tolerance)
+            and case["time"] - before["time"] > min_time
+        ):
+            found.append(
+                f"{case_key(case)}: time {before['time']:.4f}s -> {case['time']:.4f}s"
+            )
+        if (
+            case["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance)
+            and case["peak_rss_mb"] - before["peak_rss_mb"] > min_rss
+        ):
+            found.append(
+                f"{case_key(case)}: peak RSS {before['peak_rss_mb']:.1f}MB -> "
+                f"{case['peak_rss_mb']:.1f}MB"
+            )
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--regex", default="a* b")
+    parser.add_argument("--starts", default="1,10,100", type=str)
+    parser.add_argument("--formats", default=",".join(FORMATS), type=str)
+    parser.add_argument("--engines", default=",".join(ENGINES), type=str)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="JSON file to write results to")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.005,
+        help="ignore slowdowns smaller than this many seconds",
+    )
+    parser.add_argument(
+        "--min-rss",
+        type=float,
+        default=1.0,
+        help="ignore peak RSS growth smaller than this many megabytes",
+    )
+    args = parser.parse_args()
+    args.starts = [int(count) for count in args.starts.split(",")]
+    args.formats = args.formats.split(",")
+    args.engines = args.engines.split(",")
+
+    results = run_all(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"regex": args.regex, "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        found = regressions(
+            results, baseline, args.tolerance, args.min_time, args.min_rss
+        )
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+from scipy.sparse import csr_matrix, issparse
+import numpy as np
+
+
+class BitMatrix:
+    """
+    Dense boolean matrix with every row packed into ``uint64`` words (bit ``j``
+    of word ``w`` is column ``64 * w + j``, padding bits are always zero).
+
+    Implements the subset of the scipy sparse interface used by the engines:
+    ``@`` (OR of ANDs, also with a boolean vector), ``+``, ``>`` (difference), ``!=``, ``.T``, ``nnz``,
+    ``nonzero()``, row/column indexing, so it can be passed as ``matrix_class``.
+    """
+
+    dtype = np.dtype(bool)
+    # rows unpacked at once by nonzero()
+    chunk_rows = 1024
+
+    def __init__(self, matrix, shape=None):
+        if isinstance(matrix, BitMatrix):
+            self.shape, self.words = matrix.shape, matrix.words.copy()
+        elif isinstance(matrix, tuple) and shape is None:
+            self.shape = matrix
+            self.words = np.zeros((matrix[0], _word_count(matrix[1])), dtype=np.uint64)
+        elif issparse(matrix):
+            matrix = matrix.tocoo()
+            self.shape = matrix.shape
+            self.words = np.zeros(
+                (matrix.shape[0], _word_count(matrix.shape[1])), dtype=np.uint64
+            )
+            keep = matrix.data.astype(bool)
+            rows, cols = matrix.row[keep], matrix.col[keep].astype(np.uint64)
+            np.bitwise_or.at(
+                self.words,
+                (rows, cols >> np.uint64(6)),
+                np.uint64(1) << (cols & np.uint64(63)),
+            )
+        else:
+            self.shape, self.words = shape, matrix
+            if shape is None:
+                dense = np.asarray(matrix, dtype=bool)
+                self.shape, self.words = dense.shape, _pack_rows(dense)
+
+    @property
+    def nnz(self) -> int:
+        return int(np.bitwise_count(self.words).sum())
+
+    def _unpack(self, words) -> np.ndarray:
+        bits = np.unpackbits(words.view(np.uint8), axis=1, bitorder="little")
+        return bits[:, : self.shape[1]].astype(bool)
+
+    def toarray(self) -> np.ndarray:
+        return self._unpack(self.words)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.toarray() if dtype is None else self.toarray().astype(dtype)
+
+    def nonzero(self) -> tuple[np.ndarray, np.ndarray]:
+        rows, cols = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for begin in range(0, self.shape[0], self.chunk_rows):
+            i, j = np.nonzero(self._unpack(self.words[begin : begin + self.chunk_rows]))
+            rows.append(i + begin)
+            cols.append(j)
+        return np.concatenate(rows), np.concatenate(cols)
+
+    def tocsr(self) -> csr_matrix:
+        rows, cols = self.nonzero()
+        data = np.ones(len(rows), dtype=bool)
+        return csr_matrix((data, (rows, cols)), shape=self.shape)
+
+    @property
+    def T(self) -> "BitMatrix":
+        """Transpose of the packed words, by 64x64 bit blocks."""
+        rows, cols = self.shape
+        row_words, col_words = _word_count(rows), self.words.shape[1]
+        padded = np.zeros((row_words * 64, col_words), dtype=np.uint64)
+        padded[:rows] = self.words
+        # blocks[i, w, r] is word w of row 64 * i + r
+        blocks = _transpose_blocks(padded.reshape(row_words, 64, col_words))
+        words = blocks.transpose(1, 2, 0).reshape(col_words * 64, row_words)
+        return BitMatrix(np.ascontiguousarray(words[:cols]), (cols, rows))
+
+    def __getitem__(self, key) -> "BitMatrix":
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        words = self.words[rows]
+        if words.ndim == 1:
+            words = words[None, :]
+        if isinstance(cols, slice) and cols == slice(None):
+            return BitMatrix(words, (words.shape[0], self.shape[1]))
+        return BitMatrix(self._unpack(words)[:, cols])
+
+    def _words(self, other) -> np.ndarray:
+        if not isinstance(other, BitMatrix):
+            other = BitMatrix(other)
+        if other.shape != self.shape:
+            raise ValueError(f"Shape mismatch: {self.shape} and {other.shape}")
+        return other.words
+
+    def __add__(self, other) -> "BitMatrix":
+        return BitMatrix(self.words | self._words(other), self.shape)
+
+    def __radd__(self, other) -> "BitMatrix":
+        # sum() starts from 0
+        return self if isinstance(other, int) and other == 0 else self + other
+
+    __or__ = __add__
+
+    def __gt__(self, other) -> "BitMatrix":
+        return BitMatrix(self.words & ~self._words(other), self.shape)
+
+    def __ne__(self, other) -> "BitMatrix":
+        return BitMatrix(self.words ^ self._words(other), self.shape)
+
+    def __matmul__(self, other) -> "BitMatrix | np.ndarray":
+        if isinstance(other, np.ndarray) and other.ndim == 1:
+            # boolean vector result, as scipy matrices give for a 1-D operand
+            if self.shape[1] != len(other):
+                raise ValueError(f"Shape mismatch: {self.shape} @ {other.shape}")
+            vector = _pack_rows(np.asarray(other, dtype=bool)[None, :])[0]
+            return (self.words & vector).any(axis=1)
+        if not isinstance(other, BitMatrix):
+            other = BitMatrix(other)
+        if self.shape[1] != other.shape[0]:
+            raise ValueError(f"Shape mismatch: {self.shape} @ {other.shape}")
+        result = np.zeros((self.shape[0], other.words.shape[1]), dtype=np.uint64)
+        # OR row k of other into every row having column k, for non-empty rows k
+        for k in np.flatnonzero(other.words.any(axis=1)).tolist():
+            column = (self.words[:, k >> 6] >> np.uint64(k & 63)) & np.uint64(1)
+            rows = np.flatnonzero(column)
+            if len(rows):
+                result[rows] |= other.words[k]
+        return BitMatrix(result, (self.shape[0], other.shape[1]))
+
+
+def _word_count(cols: int) -> int:
+    return (cols + 63) // 64
+
+
+def _transpose_blocks(words: np.ndarray) -> np.ndarray:
+    """
+    Transposes every 64x64 bit block ``words[i, :, w]`` of 64 row words: six
+    rounds swap the off-diagonal quarters of 32, 16, ..., 1 bit squares.
+    Returns an ``(i, w, 64)`` array of the words of the transposed rows.
+    """
+    blocks = words.transpose(0, 2, 1).copy()
+    width, mask = 32, np.uint64(0x00000000FFFFFFFF)
+    while width:
+        low = np.array([k for k in range(64) if not k & width])
+        shift = np.uint64(width)
+        upper, lower = blocks[..., low], blocks[..., low + width]
+        swap = ((upper >> shift) ^ lower) & mask
+        blocks[..., low] = upper ^ (swap << shift)
+        blocks[..., low + width] = lower ^ swap
+        width //= 2
+        mask ^= mask << np.uint64(width)
+    return blocks
+
+
+def _pack_rows(dense: np.ndarray) -> np.ndarray:
+    padded = np.zeros((dense.shape[0], _word_count(dense.shape[1]) * 64), dtype=bool)
+    padded[:, : dense.shape[1]] = dense
+    return np.packbits(padded, axis=1, bitorder="little").view(np.uint64)
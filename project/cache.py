@@ -0,0 +1,69 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import hashlib
+import pathlib
+import pickle
+
+
+class CompileCache(ABC):
+    """
+    Process-wide LRU cache of compiled objects keyed by a canonical string
+    (``key``), with hit/miss counters. If ``cache_dir`` is given, compiled
+    entries are also pickled there and reused by later processes.
+    """
+
+    def __init__(self, maxsize: int = 256, cache_dir: pathlib.Path = None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @abstractmethod
+    def key(self, obj) -> str:
+        """Canonical string of ``obj``, equal for objects compiled the same."""
+
+    @abstractmethod
+    def build(self, obj):
+        """Compiles ``obj`` on a cache miss."""
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _disk_path(self, key: str) -> pathlib.Path:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return pathlib.Path(self.cache_dir) / f"{digest}.pkl"
+
+    def _compile(self, key: str, obj):
+        if self.cache_dir is not None:
+            path = self._disk_path(key)
+            if path.exists():
+                with open(path, "rb") as f:
+                    return pickle.load(f)
+
+        entry = self.build(obj)
+        if self.cache_dir is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "wb") as f:
+                pickle.dump(entry, f)
+        return entry
+
+    def get(self, obj):
+        key = self.key(obj)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        entry = self._compile(key, obj)
+        if self.maxsize > 0:
+            self._entries[key] = entry
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
@@ -1,8 +1,32 @@
 import cfpq_data
+import hashlib
+import json
 import networkx as nx
-from collections import namedtuple
+import numpy as np
+import os
+import pandas as pd
+import pathlib
+from collections import Counter, namedtuple
+from project.task2 import (
+    GraphMatrices,
+    _index_dtype,
+    _save_label,
+    _save_layout,
+    bool_matrix,
+)
 
 GraphInfo = namedtuple("GraphInfo", ["nodes_count", "edges_count", "labels_set"])
+GraphStats = namedtuple(
+    "GraphStats", ["nodes_count", "edges_count", "labels_set", "labels_count"]
+)
+
+GRAPH_MATRICES_DIR = pathlib.Path.home() / ".cache" / "formal-lang-course" / "graphs"
+# environment variable overriding GRAPH_MATRICES_DIR, read on every call
+GRAPH_CACHE_ENV = "FORMAL_LANG_COURSE_CACHE"
+
+
+def graph_cache_dir() -> pathlib.Path:
+    return pathlib.Path(os.environ.get(GRAPH_CACHE_ENV, GRAPH_MATRICES_DIR))
 
 
 def load_graph(name: str) -> nx.MultiDiGraph:
@@ -14,19 +38,193 @@ def save_graph(graph: nx.MultiDiGraph, path: str):
     nx.drawing.nx_pydot.write_dot(graph, path)
 
 
-def get_graph_info_by_name(name: str) -> GraphInfo:
-    return graph_info(load_graph(name=name))
+def file_checksum(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
 
-def graph_info(graph: nx.MultiDiGraph) -> GraphInfo:
-    """Returns summary about graph :class:`nx.MultiDiGraph`"""
+def _edge_chunks(csv_path, chunksize: int):
+    return pd.read_csv(
+        csv_path,
+        sep=" ",
+        header=None,
+        names=["from", "to", "label"],
+        dtype={"label": str},
+        engine="c",
+        chunksize=chunksize,
+    )
+
+
+def _write_stats(path, checksum: str, stats: GraphStats):
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "checksum": checksum,
+                "nodes_count": stats.nodes_count,
+                "edges_count": stats.edges_count,
+                "labels_count": stats.labels_count,
+            },
+            f,
+        )
+
+
+def csv_stats(csv_path, chunksize: int = 10**6) -> GraphStats:
+    """Counts nodes, edges and edges per label of CFPQ_Data CSV edge list chunk by chunk."""
+    nodes = np.empty(0, dtype=np.int64)
+    labels_count = Counter()
+    for chunk in _edge_chunks(csv_path, chunksize):
+        ends = np.concatenate((chunk["from"].to_numpy(np.int64), chunk["to"]))
+        nodes = np.union1d(nodes, ends)
+        labels_count.update(chunk["label"].value_counts().to_dict())
+    return GraphStats(
+        len(nodes),
+        labels_count.total(),
+        set(labels_count),
+        {label: int(count) for label, count in labels_count.items()},
+    )
+
+
+def csv_to_matrices(csv_path, path, chunksize: int = 10**6) -> GraphStats:
+    """
+    Streams CFPQ_Data CSV edge list chunk by chunk into per-label CSR arrays
+    saved to directory ``path`` (see :meth:`GraphMatrices.save`).
+    Edge ends are appended to a spill file per label while reading, then
+    every label is converted on its own, so besides the sorted node ids only
+    the edges of one label are held in memory.
+    """
+    path = pathlib.Path(path)
+    spill = path / "edges.tmp"
+    spill.mkdir(parents=True, exist_ok=True)
+    nodes = np.empty(0, dtype=np.int64)
+    label_ids, labels_count = dict(), Counter()
+    for chunk in _edge_chunks(csv_path, chunksize):
+        sources = chunk["from"].to_numpy(np.int64)
+        targets = chunk["to"].to_numpy(np.int64)
+        nodes = np.union1d(nodes, np.concatenate((sources, targets)))
+        codes, names = pd.factorize(chunk["label"])
+        order = np.argsort(codes, kind="stable")
+        bounds = np.cumsum(np.bincount(codes, minlength=len(names)))
+        for label, group in zip(names.tolist(), np.split(order, bounds[:-1])):
+            i = label_ids.setdefault(label, len(label_ids))
+            labels_count[label] += len(group)
+            with open(spill / f"{i}.edges", "ab") as f:
+                np.stack((sources[group], targets[group]), axis=1).tofile(f)
+
+    n = len(nodes)
+    index_dtype = _index_dtype(max([n] + list(labels_count.values())))
+    max_nnz = 0
+    for label, i in label_ids.items():
+        edges = np.fromfile(spill / f"{i}.edges", dtype=np.int64).reshape(-1, 2)
+        mat = bool_matrix(
+            np.searchsorted(nodes, edges[:, 0]),
+            np.searchsorted(nodes, edges[:, 1]),
+            (n, n),
+        )
+        max_nnz = max(max_nnz, _save_label(path, i, mat, index_dtype))
+        (spill / f"{i}.edges").unlink()
+    spill.rmdir()
+    _save_layout(path, nodes, list(label_ids), max_nnz)
+
+    stats = GraphStats(n, labels_count.total(), set(labels_count), dict(labels_count))
+    # written last: its presence marks a complete conversion
+    _write_stats(path / "info.json", file_checksum(csv_path), stats)
+    return stats
+
+
+def graph_matrices_path(
+    name: str, cache_dir=None, refresh: bool = False
+) -> pathlib.Path:
+    """
+    Directory with stored matrices of graph ``name`` under ``cache_dir``
+    (:func:`graph_cache_dir` by default), converted on first call. Stored
+    matrices are trusted as is: only with ``refresh`` the dataset is
+    downloaded again and reconverted if its checksum differs from the stored one.
+    """
+    path = pathlib.Path(graph_cache_dir() if cache_dir is None else cache_dir) / name
+    info_path = path / "info.json"
+    if info_path.exists() and not refresh:
+        return path
+
+    csv_path = cfpq_data.download(name)
+    if info_path.exists():
+        with open(info_path) as f:
+            if json.load(f)["checksum"] == file_checksum(csv_path):
+                return path
+        info_path.unlink()
+    (path / "stats.json").unlink(missing_ok=True)
+    csv_to_matrices(csv_path, path)
+    return path
+
+
+def load_graph_matrices(name: str, cache_dir=None, mmap: bool = True) -> GraphMatrices:
+    """Loads graph by name as per-label matrices memory-mapped from the cache."""
+    return GraphMatrices.load(graph_matrices_path(name, cache_dir), mmap=mmap)
+
+
+def get_graph_stats_by_name(
+    name: str, refresh: bool = False, cache_dir=None
+) -> GraphStats:
+    """
+    Returns stats of dataset graph stored under ``cache_dir``
+    (:func:`graph_cache_dir` by default). They are taken from converted
+    matrices or from an earlier call if there are any, otherwise the dataset
+    is downloaded and only its stats are computed and stored. Stored stats are
+    trusted as is: only with ``refresh`` the dataset is downloaded again and
+    recounted if its checksum differs from the stored one.
+    """
+    path = pathlib.Path(graph_cache_dir() if cache_dir is None else cache_dir) / name
+    info = None
+    for stored in (path / "stats.json", path / "info.json"):
+        if stored.exists():
+            with open(stored) as f:
+                info = json.load(f)
+            break
+
+    if info is None or refresh:
+        csv_path = cfpq_data.download(name)
+        checksum = file_checksum(csv_path)
+        if info is None or info["checksum"] != checksum:
+            stats = csv_stats(csv_path)
+            path.mkdir(parents=True, exist_ok=True)
+            _write_stats(path / "stats.json", checksum, stats)
+            return stats
+
+    return GraphStats(
+        info["nodes_count"],
+        info["edges_count"],
+        set(info["labels_count"]),
+        info["labels_count"],
+    )
+
+
+def get_graph_info_by_name(
+    name: str, refresh: bool = False, cache_dir=None
+) -> GraphInfo:
+    """Same as :func:`get_graph_stats_by_name` without per-label counts."""
     return GraphInfo(
+        *get_graph_stats_by_name(name, refresh=refresh, cache_dir=cache_dir)[:3]
+    )
+
+
+def graph_stats(graph: nx.MultiDiGraph) -> GraphStats:
+    """Counts nodes, edges and edges per label in one pass over graph edges."""
+    labels_count = Counter(label for _, _, label in graph.edges(data="label"))
+    return GraphStats(
         graph.number_of_nodes(),
-        graph.number_of_edges(),
-        set([d["label"] for _, _, d in graph.edges(data=True)]),
+        labels_count.total(),
+        set(labels_count),
+        dict(labels_count),
     )
 
 
+def graph_info(graph: nx.MultiDiGraph) -> GraphInfo:
+    """Returns summary about graph :class:`nx.MultiDiGraph`"""
+    return GraphInfo(*graph_stats(graph)[:3])
+
+
 def create_two_cycles_graph(
     n: int, m: int, labels: tuple = ("a", "b")
 ) -> nx.MultiDiGraph:
@@ -2,7 +2,71 @@ from pyformlang.finite_automaton import DeterministicFiniteAutomaton
 from pyformlang.finite_automaton import NondeterministicFiniteAutomaton
 from pyformlang.regular_expression import Regex
 from networkx import MultiDiGraph
+from scipy.sparse import coo_matrix, csr_matrix
 from typing import Set
+from project.cache import CompileCache
+import json
+import numpy as np
+import pandas as pd
+import pathlib
+import re
+
+# components of the academic regex syntax, split the same way as pyformlang's
+# _pre_process_regex and _get_regex_componants do: special characters and
+# spaces separate symbols, "\" escapes the next character
+_REGEX_SPECIAL = ".|+*$()"
+
+
+def _regex_components(regex: str) -> list[str]:
+    regex = regex.strip(" ")
+    if regex.endswith("\\") and not regex.endswith("\\\\"):
+        regex += " "
+    regex = re.sub(" +", " ", regex).replace("\\ ", "\\  ")
+    if regex.endswith("  "):
+        regex = regex[:-1]
+
+    spaced, previous_is_escape = [], False
+    for pos, c in enumerate(regex):
+        special = not previous_is_escape and c in _REGEX_SPECIAL
+        if special and pos != 0 and spaced[-1] != " ":
+            spaced.append(" ")
+        spaced.append(c)
+        if special and pos != len(regex) - 1 and regex[pos + 1] != " ":
+            spaced.append(" ")
+        previous_is_escape = c == "\\"
+
+    components = []
+    for component in "".join(spaced).split(" "):
+        # a space escaped by the previous component belongs to it
+        if component.endswith("\\") and not component.endswith("\\\\"):
+            component += " "
+        if component:
+            components.append(component)
+    return components
+
+
+class CompiledRegex:
+    """Minimized DFA of a regex and its matrix forms, attached lazily by task3."""
+
+    def __init__(self, dfa: DeterministicFiniteAutomaton):
+        self.dfa = dfa
+        self.automata = dict()
+
+
+class RegexCache(CompileCache):
+    """
+    Compiled regular expressions keyed by their components, so regexes that
+    differ only in spacing share an entry.
+    """
+
+    def key(self, regex: str) -> str:
+        return " ".join(_regex_components(regex))
+
+    def build(self, regex: str) -> CompiledRegex:
+        return CompiledRegex(Regex(regex).to_epsilon_nfa().minimize())
+
+
+REGEX_CACHE = RegexCache()
 
 
 def regex_to_dfa(regex: str) -> DeterministicFiniteAutomaton:
@@ -11,8 +75,8 @@ def regex_to_dfa(regex: str) -> DeterministicFiniteAutomaton:
     Keyword arguments:
     expr -- academic regular expression string;
     """
-    dfa = Regex(regex).to_epsilon_nfa()
-    return dfa.minimize()
+    # cached DFA is shared, callers get their own copy
+    return REGEX_CACHE.get(regex).dfa.copy()
 
 
 def graph_to_nfa(
@@ -47,3 +111,193 @@ def graph_to_nfa(
             nfa.add_transition(source, label, dest)
 
     return nfa
+
+
+def bool_matrix(rows, cols, shape, matrix_class=csr_matrix):
+    """Builds boolean matrix of ``matrix_class`` from (row, col) index arrays in one call."""
+    data = np.ones(len(rows), dtype=bool)
+    return matrix_class(coo_matrix((data, (rows, cols)), shape=shape, dtype=bool))
+
+
+def _node_array(nodes) -> np.ndarray:
+    if all(isinstance(node, (int, np.integer)) for node in nodes):
+        return np.array(nodes, dtype=np.int64)
+    array = np.empty(len(nodes), dtype=object)
+    for i, node in enumerate(nodes):
+        array[i] = node
+    return array
+
+
+def _index_dtype(count: int):
+    return np.int32 if count < 2**31 else np.int64
+
+
+def _save_label(path: pathlib.Path, i: int, mat, index_dtype) -> int:
+    """Writes CSR arrays of label ``i`` (see :meth:`GraphMatrices.save`), returns nnz."""
+    # explicit False entries would come back True with the shared ones array
+    mat = csr_matrix(mat, dtype=bool, copy=True)
+    mat.sum_duplicates()
+    mat.eliminate_zeros()
+    np.save(path / f"{i}.indptr.npy", mat.indptr.astype(index_dtype))
+    np.save(path / f"{i}.indices.npy", mat.indices.astype(index_dtype))
+    return mat.nnz
+
+
+def _save_layout(path: pathlib.Path, nodes: np.ndarray, labels: list, max_nnz: int):
+    """Writes nodes, the shared data array and ``meta.json`` next to label arrays."""
+    np.save(path / "nodes.npy", nodes)
+    # single all-true data array shared by every label matrix on load
+    np.save(path / "ones.npy", np.ones(max_nnz, dtype=bool))
+    with open(path / "meta.json", "w") as f:
+        json.dump(
+            {
+                "size": len(nodes),
+                "labels": labels,
+                "pickled_nodes": bool(nodes.dtype == object),
+            },
+            f,
+        )
+
+
+class GraphMatrices:
+    """
+    Labeled graph stored as one boolean CSR adjacency matrix per edge label.
+    ``nodes[i]`` is the graph node with matrix index ``i``.
+    """
+
+    def __init__(self, nodes, transitions: dict[str, csr_matrix]):
+        self.nodes = nodes if isinstance(nodes, np.ndarray) else _node_array(nodes)
+        self.transitions = transitions
+        self._index = None
+
+    @classmethod
+    def from_networkx(cls, graph: MultiDiGraph) -> "GraphMatrices":
+        nodes = list(graph.nodes())
+        index = {node: i for i, node in enumerate(nodes)}
+        edges = dict()
+
+        for source, dest, label in graph.edges(data="label"):
+            if label is not None:
+                rows, cols = edges.setdefault(label, ([], []))
+                rows.append(index[source])
+                cols.append(index[dest])
+
+        shape = (len(nodes), len(nodes))
+        result = cls(
+            nodes,
+            {
+                label: bool_matrix(rows, cols, shape)
+                for label, (rows, cols) in edges.items()
+            },
+        )
+        result._index = index
+        return result
+
+    @classmethod
+    def from_edges(cls, sources, targets, labels) -> "GraphMatrices":
+        """
+        Builds matrices from parallel arrays of integer edge ends and labels.
+        Nodes are all edge ends in ascending order.
+        """
+        sources, targets = np.asarray(sources), np.asarray(targets)
+        nodes = np.unique(np.concatenate((sources, targets)))
+        rows = np.searchsorted(nodes, sources)
+        cols = np.searchsorted(nodes, targets)
+
+        label_names, label_ids = np.unique(np.asarray(labels), return_inverse=True)
+        order = np.argsort(label_ids, kind="stable")
+        bounds = np.cumsum(np.bincount(label_ids, minlength=len(label_names)))
+
+        shape = (len(nodes), len(nodes))
+        transitions = {
+            label: bool_matrix(rows[chunk], cols[chunk], shape)
+            for label, chunk in zip(label_names.tolist(), np.split(order, bounds[:-1]))
+        }
+        return cls(nodes, transitions)
+
+    @classmethod
+    def from_csv(cls, path) -> "GraphMatrices":
+        """Loads CFPQ_Data edge list (``from to label`` per line)."""
+        data = pd.read_csv(
+            path, sep=" ", header=None, names=["from", "to", "label"], engine="c"
+        )
+        return cls.from_edges(
+            data["from"].to_numpy(),
+            data["to"].to_numpy(),
+            data["label"].astype(str).to_numpy(),
+        )
+
+    def size(self) -> int:
+        return len(self.nodes)
+
+    def labels(self):
+        return self.transitions.keys()
+
+    def number_of_edges(self) -> int:
+        return sum(mat.nnz for mat in self.transitions.values())
+
+    def index(self) -> dict:
+        if self._index is None:
+            self._index = {node: i for i, node in enumerate(self.nodes.tolist())}
+        return self._index
+
+    def indices(self, nodes) -> np.ndarray:
+        """Matrix indices of ``nodes``, nodes absent from the graph are skipped."""
+        index = self.index()
+        return np.array([index[v] for v in nodes if v in index], dtype=np.int64)
+
+    def save(self, path):
+        """
+        Saves matrices to directory ``path``: ``nodes.npy``, CSR ``indptr``/``indices``
+        arrays per label (files are named by label id) and ``meta.json`` with labels.
+        """
+        path = pathlib.Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        index_dtype = _index_dtype(
+            max([self.size()] + [mat.nnz for mat in self.transitions.values()])
+        )
+        max_nnz = max(
+            (
+                _save_label(path, i, mat, index_dtype)
+                for i, mat in enumerate(self.transitions.values())
+            ),
+            default=0,
+        )
+        _save_layout(path, self.nodes, list(self.transitions), max_nnz)
+
+    @classmethod
+    def load(cls, path, mmap: bool = True) -> "GraphMatrices":
+        """Loads matrices saved by :meth:`save`, memory-mapping arrays if ``mmap``."""
+        path = pathlib.Path(path)
+        mmap_mode = "r" if mmap else None
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+
+        n = meta["size"]
+        ones = np.load(path / "ones.npy", mmap_mode=mmap_mode)
+        transitions = dict()
+        for i, label in enumerate(meta["labels"]):
+            indptr = np.load(path / f"{i}.indptr.npy", mmap_mode=mmap_mode)
+            indices = np.load(path / f"{i}.indices.npy", mmap_mode=mmap_mode)
+            transitions[label] = csr_matrix(
+                (ones[: len(indices)], indices, indptr), shape=(n, n), copy=False
+            )
+        if meta["pickled_nodes"]:
+            nodes = np.load(path / "nodes.npy", allow_pickle=True)
+        else:
+            nodes = np.load(path / "nodes.npy", mmap_mode=mmap_mode)
+        return cls(nodes, transitions)
+
+    def edges(self):
+        """Yields ``(source, dest, label)`` node triples."""
+        nodes = self.nodes.tolist()
+        for label, mat in self.transitions.items():
+            rows, cols = mat.nonzero()
+            for u, v in zip(rows.tolist(), cols.tolist()):
+                yield nodes[u], nodes[v], label
+
+
+def graph_to_matrices(graph: MultiDiGraph | GraphMatrices) -> GraphMatrices:
+    if isinstance(graph, GraphMatrices):
+        return graph
+    return GraphMatrices.from_networkx(graph)
@@ -2,18 +2,33 @@ from pyformlang.finite_automaton import (
     DeterministicFiniteAutomaton,
     NondeterministicFiniteAutomaton,
     State,
+    Symbol,
 )
 from scipy.sparse import kron
 from networkx import MultiDiGraph
-from project.task2 import graph_to_nfa, regex_to_dfa
-from scipy.sparse import dok_matrix
+from project.bitmatrix import BitMatrix
+from project.task2 import (
+    REGEX_CACHE,
+    GraphMatrices,
+    _node_array,
+    _regex_components,
+    bool_matrix,
+    graph_to_matrices,
+)
+from scipy.sparse import coo_matrix, csr_matrix, dok_matrix, identity
+import numpy as np
+import pathlib
 
 
 class FiniteAutomaton:
     transitions = None
-    start_states = None
-    final_states = None
-    states_mapping = None
+    _start_states = None
+    _final_states = None
+    _states_mapping = None
+    _indices_cache = None
+    # graph automata from graph_to_mat keep the node array and start/final
+    # indices, State objects are made only if the state attributes are read
+    _nodes = None
     is_deterministic = True
     epsilon_symbol = None
     number_of_states = None
@@ -21,25 +36,38 @@ class FiniteAutomaton:
     def __init__(
         self,
         obj: any,
-        start_states=set(),
-        final_states=set(),
-        states_mapping=dict(),
-        matrix_class=dok_matrix,
+        start_states=None,
+        final_states=None,
+        states_mapping=None,
+        matrix_class=csr_matrix,
     ):
-        if isinstance(obj, DeterministicFiniteAutomaton) or isinstance(
+        start_states = set() if start_states is None else start_states
+        final_states = set() if final_states is None else final_states
+        states_mapping = dict() if states_mapping is None else states_mapping
+
+        if isinstance(obj, GraphMatrices):
+            obj = graph_to_mat(obj, start_states, final_states, matrix_class)
+        elif isinstance(obj, DeterministicFiniteAutomaton) or isinstance(
             obj, NondeterministicFiniteAutomaton
         ):
-            mat = nfa_to_mat(obj, matrix_class=matrix_class)
+            obj = nfa_to_mat(obj, matrix_class=matrix_class)
+        elif isinstance(obj, CompactAutomaton):
+            obj = obj.to_automaton()
+
+        if isinstance(obj, FiniteAutomaton) and obj._nodes is not None:
+            self.transitions = obj.transitions
+            self._nodes, self._indices_cache = obj._nodes, obj._indices_cache
+        elif isinstance(obj, FiniteAutomaton):
             (
                 self.transitions,
                 self.start_states,
                 self.final_states,
                 self.states_mapping,
             ) = (
-                mat.transitions,
-                mat.start_states,
-                mat.final_states,
-                mat.states_mapping,
+                obj.transitions,
+                obj.start_states,
+                obj.final_states,
+                obj.states_mapping,
             )
         else:
             self.transitions = obj
@@ -48,36 +76,168 @@ class FiniteAutomaton:
             self.states_mapping = states_mapping
 
     def accepts(self, word) -> bool:
-        nfa = mat_to_nfa(self)
-        return nfa.accepts("".join(list(word)))
+        """
+        Simulates the automaton on ``word`` (iterable of symbols) directly on
+        the transition matrices: the boolean vector of current states is
+        multiplied by the matrix of every next symbol.
+        """
+        states = self.start_mask()
+        for symbol in word:
+            mat = self.transitions.get(symbol)
+            if mat is None:
+                return False
+            states = mat.T @ states
+            if not states.any():
+                return False
+        return bool((states & self.final_mask()).any())
+
+    def accepts_many(self, words) -> list[bool]:
+        return self.accepts_batch(words).tolist()
+
+    def accepts_batch(self, words) -> np.ndarray:
+        """
+        Checks all ``words`` at once: they are put into a prefix trie which is
+        walked depth-first, so the state vector of a shared prefix is computed
+        only once. Returns a boolean array aligned with ``words``.
+        """
+        # trie node is (children by symbol, indices of words ending in it)
+        root = (dict(), [])
+        count = 0
+        for count, word in enumerate(words, start=1):
+            node = root
+            for symbol in word:
+                node = node[0].setdefault(symbol, (dict(), []))
+            node[1].append(count - 1)
+
+        result = np.zeros(count, dtype=bool)
+        steps = {label: _as_csr(mat.T) for label, mat in self.transitions.items()}
+        final = self.final_mask()
+        stack = [(root, self.start_mask())]
+        while stack:
+            (children, ends), states = stack.pop()
+            if ends:
+                result[ends] = (states & final).any()
+            for symbol, child in children.items():
+                step = steps.get(symbol)
+                if step is None:
+                    continue
+                next_states = step @ states
+                if next_states.any():
+                    stack.append((child, next_states))
+
+        return result
+
+    def save(self, path):
+        """Saves automaton to directory ``path``, see :meth:`CompactAutomaton.save`."""
+        CompactAutomaton.from_automaton(self).save(path)
+
+    @classmethod
+    def load(cls, path, mmap: bool = True) -> "FiniteAutomaton":
+        return cls(CompactAutomaton.load(path, mmap))
 
     def is_empty(self) -> bool:
         closure = transitive_closure(self)
-        for ss in self.start_states:
-            for tt in self.final_states:
-                ss_index = self.states_mapping[ss]
-                tt_index = self.states_mapping[tt]
-                try:
-                    if closure[ss_index, tt_index]:
-                        return False
-                except:
-                    pass
-        return True
-
-    def final_indices(self):
-        return [self.map_state_index(t) for t in self.final_states]
-
-    def start_indices(self):
-        return [self.map_state_index(t) for t in self.start_states]
+        if closure.shape[0] == 0:
+            return True
+        return closure[self.start_indices()][:, self.final_indices()].nnz == 0
+
+    @classmethod
+    def from_indices(
+        cls, transitions: dict, nodes: np.ndarray, start: np.ndarray, final: np.ndarray
+    ) -> "FiniteAutomaton":
+        """
+        Automaton whose state ``i`` is ``State(nodes[i])``, with start and final
+        states given as index arrays.
+        """
+        automaton = cls(transitions)
+        automaton._nodes = nodes
+        automaton._indices_cache = {"start_indices": start, "final_indices": final}
+        return automaton
+
+    def _materialize(self):
+        if self._nodes is None:
+            return
+        nodes, self._nodes = self._nodes, None
+        start, final = self.start_indices(), self.final_indices()
+        self._states_mapping = {State(v): i for i, v in enumerate(nodes.tolist())}
+        self._start_states = {State(v) for v in nodes[start].tolist()}
+        self._final_states = {State(v) for v in nodes[final].tolist()}
+
+    # start/final index arrays and masks are cached until any of the state
+    # attributes below is reassigned
+    @property
+    def start_states(self):
+        self._materialize()
+        return self._start_states
+
+    @start_states.setter
+    def start_states(self, states):
+        self._materialize()
+        self._start_states = states
+        self._indices_cache = None
+
+    @property
+    def final_states(self):
+        self._materialize()
+        return self._final_states
+
+    @final_states.setter
+    def final_states(self, states):
+        self._materialize()
+        self._final_states = states
+        self._indices_cache = None
+
+    @property
+    def states_mapping(self):
+        self._materialize()
+        return self._states_mapping
+
+    @states_mapping.setter
+    def states_mapping(self, mapping):
+        self._materialize()
+        self._states_mapping = mapping
+        self._indices_cache = None
+
+    def _cached(self, key, build):
+        if self._indices_cache is None:
+            self._indices_cache = dict()
+        if key not in self._indices_cache:
+            self._indices_cache[key] = build()
+        return self._indices_cache[key]
+
+    def _mask(self, indices):
+        mask = np.zeros(self.size(), dtype=bool)
+        mask[indices] = True
+        return mask
+
+    def final_indices(self) -> np.ndarray:
+        return self._cached(
+            "final_indices",
+            lambda: np.array(
+                [self.map_state_index(t) for t in self.final_states], dtype=np.int64
+            ),
+        )
 
-    def labels(self):
-        return (
-            self.states_mapping.keys()
-            if self.is_deterministic
-            else self.transitions.keys()
+    def start_indices(self) -> np.ndarray:
+        return self._cached(
+            "start_indices",
+            lambda: np.array(
+                [self.map_state_index(t) for t in self.start_states], dtype=np.int64
+            ),
         )
 
+    def final_mask(self) -> np.ndarray:
+        return self._cached("final_mask", lambda: self._mask(self.final_indices()))
+
+    def start_mask(self) -> np.ndarray:
+        return self._cached("start_mask", lambda: self._mask(self.start_indices()))
+
+    def labels(self):
+        return self.transitions.keys()
+
     def size(self):
+        if self._nodes is not None:
+            return len(self._nodes)
         return len(self.states_mapping)
 
     def map_state_index(self, state):
@@ -86,125 +246,764 @@ class FiniteAutomaton:
     def indices_dict(self):
         return {i: v for v, i in self.states_mapping.items()}
 
+    def state_values(self) -> np.ndarray:
+        """Values of the states by index, graph automata give their node array."""
+        if self._nodes is not None:
+            return self._nodes
+
+        def build():
+            values = [None] * self.size()
+            for state, i in self.states_mapping.items():
+                values[i] = state.value
+            return _node_array(values)
+
+        return self._cached("state_values", build)
+
+
+class CompactAutomaton:
+    """
+    Array-backed automaton: state with index ``i`` is ``states[i]``, start and
+    final states are boolean masks, ``matrices[j]`` is the transition matrix
+    of ``labels[j]`` and labels are sorted. Convertible to and from
+    :class:`FiniteAutomaton`.
+    """
+
+    __slots__ = ("states", "labels", "matrices", "start", "final")
+
+    def __init__(self, states, labels, matrices, start, final):
+        self.states = states
+        self.labels = labels
+        self.matrices = matrices
+        self.start = start
+        self.final = final
+
+    @classmethod
+    def from_automaton(cls, automaton: FiniteAutomaton) -> "CompactAutomaton":
+        transitions = {str(label): mat for label, mat in automaton.transitions.items()}
+        labels = np.array(sorted(transitions), dtype=str)
+        return cls(
+            automaton.state_values(),
+            labels,
+            tuple(csr_matrix(transitions[label], dtype=bool) for label in labels),
+            automaton.start_mask().copy(),
+            automaton.final_mask().copy(),
+        )
+
+    def to_automaton(self) -> FiniteAutomaton:
+        """Automaton over the same arrays, State objects are made only on demand."""
+        return FiniteAutomaton.from_indices(
+            {Symbol(str(label)): mat for label, mat in zip(self.labels, self.matrices)},
+            self.states,
+            self.start_indices(),
+            self.final_indices(),
+        )
+
+    def save(self, path):
+        """
+        Saves automaton to directory ``path`` in :meth:`GraphMatrices.save`
+        layout (states as nodes, label table in ``meta.json``) plus ``start.npy``
+        and ``final.npy`` masks.
+        """
+        path = pathlib.Path(path)
+        GraphMatrices(self.states, dict(zip(self.labels.tolist(), self.matrices))).save(
+            path
+        )
+        np.save(path / "start.npy", self.start)
+        np.save(path / "final.npy", self.final)
+
+    @classmethod
+    def load(cls, path, mmap: bool = True) -> "CompactAutomaton":
+        """Loads automaton saved by :meth:`save`, memory-mapping arrays if ``mmap``."""
+        path = pathlib.Path(path)
+        mmap_mode = "r" if mmap else None
+        graph = GraphMatrices.load(path, mmap)
+        return cls(
+            graph.nodes,
+            np.array(list(graph.transitions), dtype=str),
+            tuple(graph.transitions.values()),
+            np.load(path / "start.npy", mmap_mode=mmap_mode),
+            np.load(path / "final.npy", mmap_mode=mmap_mode),
+        )
+
+    def size(self) -> int:
+        return len(self.states)
+
+    def start_indices(self) -> np.ndarray:
+        return np.flatnonzero(self.start)
+
+    def final_indices(self) -> np.ndarray:
+        return np.flatnonzero(self.final)
+
+    def matrix(self, label) -> csr_matrix | None:
+        label = str(label)
+        j = np.searchsorted(self.labels, label)
+        if j < len(self.labels) and self.labels[j] == label:
+            return self.matrices[j]
+        return None
+
 
 def nfa_to_mat(
-    automaton: NondeterministicFiniteAutomaton, matrix_class=dok_matrix
+    automaton: NondeterministicFiniteAutomaton, matrix_class=csr_matrix
 ) -> FiniteAutomaton:
-    states = automaton.to_dict()
     len_states = len(automaton.states)
     states_mapping = {v: i for i, v in enumerate(automaton.states)}
-    transitions = dict()
-
-    for label in automaton.symbols:
-        transitions[label] = matrix_class((len_states, len_states), dtype=bool)
-        for u, edges in states.items():
-            if label in edges:
-                targets = edges[label]
-                if not isinstance(targets, set):
-                    targets = {targets}
-                for v in targets:
-                    transitions[label][states_mapping[u], states_mapping[v]] = True
+    edges = {label: ([], []) for label in automaton.symbols}
+
+    for u, transitions in automaton.to_dict().items():
+        for label, targets in transitions.items():
+            if label not in edges:
+                continue
+            if not isinstance(targets, set):
+                targets = {targets}
+            rows, cols = edges[label]
+            for v in targets:
+                rows.append(states_mapping[u])
+                cols.append(states_mapping[v])
+
+    transitions = {
+        label: bool_matrix(rows, cols, (len_states, len_states), matrix_class)
+        for label, (rows, cols) in edges.items()
+    }
 
     return FiniteAutomaton(
         transitions, automaton.start_states, automaton.final_states, states_mapping
     )
 
 
+def regex_to_mat(regex: str, matrix_class=csr_matrix) -> FiniteAutomaton:
+    """
+    Matrix automaton of the minimized DFA of ``regex``. It is built once per
+    matrix class and kept in ``REGEX_CACHE`` next to the DFA, every call
+    returns a new automaton with its own transitions dict and state sets over
+    the shared transition matrices.
+    """
+    compiled = REGEX_CACHE.get(regex)
+    if matrix_class not in compiled.automata:
+        compiled.automata[matrix_class] = nfa_to_mat(
+            compiled.dfa, matrix_class=matrix_class
+        )
+    cached = compiled.automata[matrix_class]
+    return FiniteAutomaton(
+        dict(cached.transitions),
+        set(cached.start_states),
+        set(cached.final_states),
+        dict(cached.states_mapping),
+    )
+
+
+# operator tokens of the components given by task2._regex_components
+_REGEX_OPERATORS = {".": ".", "|": "|", "+": "|", "*": "*", "(": "(", ")": ")"}
+
+
+def _regex_tokens(regex: str) -> list[tuple[str, str]]:
+    tokens = []
+    for component in _regex_components(regex):
+        if component in _REGEX_OPERATORS:
+            tokens.append((_REGEX_OPERATORS[component], None))
+        elif component in ("$", "epsilon"):
+            tokens.append(("$", None))
+        elif component[0] == "\\":
+            tokens.append(("symbol", component[1:]))
+        else:
+            tokens.append(("symbol", component))
+    return tokens
+
+
+class _GlushkovParser:
+    """
+    Recursive descent parser computing Glushkov sets bottom-up. Every
+    subexpression is returned as (nullable, first positions, last positions),
+    follow relation is collected as (last positions, first positions) blocks.
+    """
+
+    def __init__(self, regex: str):
+        self.tokens = _regex_tokens(regex)
+        self.pos = 0
+        self.labels = []
+        self.follow = []
+
+    def peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def parse(self):
+        if not self.tokens:
+            return None
+        result = self.union()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected {self.peek()!r} in regex")
+        return result
+
+    def missing_operand(self):
+        # pyformlang reads an operator at the end of a group as applied to
+        # the empty language, so "a|" is "a" and "a." matches nothing
+        return self.peek() in (None, ")")
+
+    def union(self):
+        nullable, first, last = self.concat()
+        while self.peek() == "|":
+            self.pos += 1
+            if self.missing_operand():
+                continue
+            nullable_, first_, last_ = self.concat()
+            nullable, first, last = nullable or nullable_, first + first_, last + last_
+        return nullable, first, last
+
+    def concat(self):
+        nullable, first, last = self.star()
+        while self.peek() in ("symbol", "$", "(", "."):
+            if self.peek() == ".":
+                self.pos += 1
+                if self.missing_operand():
+                    return False, [], []
+            nullable_, first_, last_ = self.star()
+            self.follow.append((last, first_))
+            first = first + first_ if nullable else first
+            last = last_ + last if nullable_ else last_
+            nullable = nullable and nullable_
+        return nullable, first, last
+
+    def star(self):
+        nullable, first, last = self.atom()
+        while self.peek() == "*":
+            self.pos += 1
+            self.follow.append((last, first))
+            nullable = True
+        return nullable, first, last
+
+    def atom(self):
+        kind = self.peek()
+        if kind == "symbol":
+            self.labels.append(self.tokens[self.pos][1])
+            self.pos += 1
+            # position 0 is the initial state
+            return False, [len(self.labels)], [len(self.labels)]
+        if kind == "$":
+            self.pos += 1
+            return True, [], []
+        if kind == "(":
+            self.pos += 1
+            result = self.union()
+            if self.peek() != ")":
+                raise ValueError("Unbalanced parenthesis in regex")
+            self.pos += 1
+            return result
+        raise ValueError(f"Unexpected {kind!r} in regex")
+
+
+def _determinize(transitions: dict, start: np.ndarray, final: np.ndarray, n: int):
+    """Subset construction, returns (n', |labels|) successor table (-1 if none)."""
+    steps = [_as_csr(mat.T) for mat in transitions.values()]
+    initial = np.zeros(n, dtype=bool)
+    initial[start] = True
+    subsets, index, table = [initial], {initial.tobytes(): 0}, []
+    while len(table) < len(subsets):
+        row = []
+        for step in steps:
+            subset = step @ subsets[len(table)]
+            if not subset.any():
+                row.append(-1)
+                continue
+            key = subset.tobytes()
+            if key not in index:
+                index[key] = len(subsets)
+                subsets.append(subset)
+            row.append(index[key])
+        table.append(row)
+
+    table = np.array(table, dtype=np.int64).reshape(len(subsets), len(steps))
+    accepting = np.array([subset[final].any() for subset in subsets], dtype=bool)
+    return table, accepting
+
+
+def _hopcroft(table: np.ndarray, accepting: np.ndarray) -> np.ndarray:
+    """
+    Hopcroft's partition refinement of a DFA given by successor ``table``.
+    Missing transitions go to an explicit sink, which gets the last state id.
+    Returns block id of every state including the sink.
+    """
+    n, k = table.shape
+    table = np.vstack([np.where(table < 0, n, table), np.full((1, k), n)])
+    accepting = np.append(accepting, False)
+
+    # predecessors of t by label a are order[a][offsets[a][t] : offsets[a][t + 1]]
+    order = np.argsort(table, axis=0, kind="stable")
+    offsets = [
+        np.searchsorted(table[order[:, a], a], np.arange(n + 2)) for a in range(k)
+    ]
+
+    blocks = [set(np.flatnonzero(mask).tolist()) for mask in (accepting, ~accepting)]
+    blocks = [block for block in blocks if block]
+    block_of = np.zeros(n + 1, dtype=np.int64)
+    for i, block in enumerate(blocks):
+        block_of[list(block)] = i
+
+    smallest = min(range(len(blocks)), key=lambda i: len(blocks[i]))
+    work = {(smallest, a) for a in range(k)}
+    while work:
+        splitter, a = work.pop()
+        predecessors = set()
+        for t in blocks[splitter]:
+            predecessors.update(order[offsets[a][t] : offsets[a][t + 1], a].tolist())
+
+        touched = dict()
+        for s in predecessors:
+            touched.setdefault(int(block_of[s]), set()).add(s)
+        for y, inside in touched.items():
+            if len(inside) == len(blocks[y]):
+                continue
+            outside = blocks[y] - inside
+            blocks[y] = inside
+            blocks.append(outside)
+            new = len(blocks) - 1
+            block_of[list(outside)] = new
+            for c in range(k):
+                if (y, c) in work or len(outside) <= len(inside):
+                    work.add((new, c))
+                else:
+                    work.add((y, c))
+
+    return block_of
+
+
+def compile_regex(
+    regex: str, minimize: bool = False, matrix_class=csr_matrix
+) -> FiniteAutomaton:
+    """
+    Compiles ``regex`` (academic syntax of pyformlang's ``Regex``) into the
+    epsilon-free Glushkov automaton without pyformlang: state 0 is initial,
+    state ``p`` is the ``p``-th symbol occurrence of the regex.
+
+    With ``minimize`` the automaton is determinized and minimized by
+    Hopcroft's algorithm, giving the same DFA as :func:`regex_to_dfa` up to
+    state numbering (without the dead state).
+    """
+    parser = _GlushkovParser(regex)
+    parsed = parser.parse()
+    n = len(parser.labels) + 1
+    if parsed is None:
+        # empty regex denotes the empty language
+        nullable, first, last = False, [], []
+    else:
+        nullable, first, last = parsed
+
+    rows = [np.zeros(len(first), dtype=np.int64)]
+    cols = [np.array(first, dtype=np.int64)]
+    for last_, first_ in parser.follow:
+        rows.append(np.repeat(np.array(last_, dtype=np.int64), len(first_)))
+        cols.append(np.tile(np.array(first_, dtype=np.int64), len(last_)))
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+
+    # every edge is labeled by the symbol of its target position
+    labels, label_ids = np.unique(
+        np.array(parser.labels, dtype=str), return_inverse=True
+    )
+    edge_labels = label_ids[cols - 1]
+    transitions = {
+        str(label): bool_matrix(
+            rows[edge_labels == i], cols[edge_labels == i], (n, n), csr_matrix
+        )
+        for i, label in enumerate(labels)
+    }
+    start = np.zeros(1, dtype=np.int64)
+    final = np.array(last + ([0] if nullable else []), dtype=np.int64)
+
+    if minimize:
+        table, accepting = _determinize(transitions, start, final, n)
+        block_of = _hopcroft(table, accepting)
+        # renumber live blocks in order of their first state, so the start
+        # block gets 0; the sink block with all dead states is dropped
+        live = [b for b in dict.fromkeys(block_of[:-1].tolist()) if b != block_of[-1]]
+        renumber = np.full(len(block_of), -1, dtype=np.int64)
+        renumber[live] = np.arange(len(live))
+        n = max(len(live), 1)
+
+        sources, edge_labels = np.nonzero(table >= 0)
+        rows = renumber[block_of[sources]]
+        cols = renumber[block_of[table[sources, edge_labels]]]
+        keep = (rows >= 0) & (cols >= 0)
+        rows, cols, edge_labels = rows[keep], cols[keep], edge_labels[keep]
+        transitions = {
+            str(label): bool_matrix(
+                rows[edge_labels == i], cols[edge_labels == i], (n, n), csr_matrix
+            )
+            for i, label in enumerate(labels)
+            if (edge_labels == i).any()
+        }
+        final = np.unique(renumber[block_of[:-1][accepting]])
+
+    return FiniteAutomaton(
+        {Symbol(label): matrix_class(mat) for label, mat in transitions.items()},
+        {State(i) for i in start.tolist()},
+        {State(i) for i in final.tolist()},
+        {State(i): i for i in range(n)},
+    )
+
+
+def graph_to_mat(
+    graph: MultiDiGraph | GraphMatrices,
+    start_states: set[int],
+    final_states: set[int],
+    matrix_class=csr_matrix,
+) -> FiniteAutomaton:
+    """
+    Builds matrix automaton from multi-digraph without intermediate pyformlang NFA.
+    Same semantics as ``nfa_to_mat(graph_to_nfa(graph, start_states, final_states))``.
+    """
+    graph = graph_to_matrices(graph)
+    every = np.arange(graph.size())
+
+    return FiniteAutomaton.from_indices(
+        {Symbol(label): matrix_class(mat) for label, mat in graph.transitions.items()},
+        graph.nodes,
+        np.unique(graph.indices(start_states)) if start_states else every,
+        np.unique(graph.indices(final_states)) if final_states else every,
+    )
+
+
 def mat_to_nfa(automaton: FiniteAutomaton) -> NondeterministicFiniteAutomaton:
     nfa = NondeterministicFiniteAutomaton()
+    states = automaton.indices_dict()
 
-    for label in automaton.transitions.keys():
-        n = automaton.transitions[label].shape[0]
-        for u in range(n):
-            for v in range(n):
-                if automaton.transitions[label][u, v]:
-                    nfa.add_transition(
-                        automaton.map_state_index(u),
-                        label,
-                        automaton.map_state_index(v),
-                    )
+    for label, mat in automaton.transitions.items():
+        rows, cols = mat.nonzero()
+        for u, v in zip(rows.tolist(), cols.tolist()):
+            nfa.add_transition(states[u], label, states[v])
 
     for start_state in automaton.start_states:
-        nfa.add_start_state(automaton.map_state_index(start_state))
+        nfa.add_start_state(start_state)
     for final_state in automaton.final_states:
-        nfa.add_final_state(automaton.map_state_index(final_state))
+        nfa.add_final_state(final_state)
 
     return nfa
 
 
-def transitive_closure(automaton: FiniteAutomaton):
-    if len(automaton.transitions.values()) == 0:
+# closure switches from sparse matrices to BitMatrix once its density
+# (nnz / n^2) exceeds this value
+DENSE_THRESHOLD = 0.1
+
+
+def transitive_closure(
+    automaton: "FiniteAutomaton | ProductAutomaton",
+    dense_threshold: float = DENSE_THRESHOLD,
+):
+    """Returns transitive closure of the union of automaton transition matrices.
+
+    Semi-naive evaluation: on each round only the pairs found on the previous
+    round (``delta``) are multiplied with the closure, so already known pairs
+    are never recomputed. Stops as soon as no new pairs appear.
+
+    Sparse closure is converted to bit-packed :class:`BitMatrix` when it gets
+    denser than ``dense_threshold``, automata built with ``BitMatrix`` as
+    ``matrix_class`` are closed densely from the start.
+    """
+    if isinstance(automaton, ProductAutomaton):
+        matrices = automaton.matrices()
+    else:
+        matrices = automaton.transitions
+    if len(matrices) == 0:
         return dok_matrix((0, 0), dtype=bool)
-    adj = sum(automaton.transitions.values())
-    last_ = -1
-    while adj.count_nonzero() != last_:
-        last_ = adj.count_nonzero()
-        adj += adj @ adj
+    adj = sum(matrices.values())
+    if not isinstance(adj, BitMatrix):
+        adj = csr_matrix(adj, dtype=bool)
+    delta = adj
+    while delta.nnz > 0:
+        n = adj.shape[0]
+        if not isinstance(adj, BitMatrix) and adj.nnz > dense_threshold * n * n:
+            adj, delta = BitMatrix(adj), BitMatrix(delta)
+        delta = (delta @ adj + adj @ delta) > adj
+        adj = adj + delta
 
     return adj
 
 
+def _as_csr(matrix) -> csr_matrix:
+    """Boolean CSR copy of a sparse matrix or a :class:`BitMatrix` (not via dense)."""
+    if isinstance(matrix, BitMatrix):
+        return matrix.tocsr()
+    return csr_matrix(matrix, dtype=bool)
+
+
+def _matrix_class(automaton: FiniteAutomaton):
+    """Class of the transition matrices of ``automaton``, CSR if there are none."""
+    return next(iter(map(type, automaton.transitions.values())), csr_matrix)
+
+
+def _as_class(matrix, matrix_class):
+    """Boolean ``matrix`` of ``matrix_class`` (a scipy class or :class:`BitMatrix`)."""
+    if matrix_class is BitMatrix:
+        return matrix if isinstance(matrix, BitMatrix) else BitMatrix(_as_csr(matrix))
+    return matrix_class(_as_csr(matrix), dtype=bool)
+
+
+class ProductAutomaton:
+    """
+    Intersection of two matrix automata that builds ``kron(A, B)`` only in
+    :meth:`matrices`.
+
+    Product state ``k`` is ``(k // n2, k % n2)`` for ``n2 = automaton2.size()``.
+    Fronts of ``r`` sources are kept as one ``(n1, r * n2)`` matrix with source
+    ``s`` in columns ``s * n2 .. s * n2 + n2``, so a step over label ``l`` is
+    ``A_l^T @ F @ (I_r x B_l)``. Only the second factor is repeated ``r`` times,
+    so it should be the smaller automaton (the regex DFA for graph queries).
+    """
+
+    def __init__(self, automaton1: FiniteAutomaton, automaton2: FiniteAutomaton):
+        self.automaton1 = automaton1
+        self.automaton2 = automaton2
+
+    def labels(self):
+        return self.automaton1.labels() & self.automaton2.labels()
+
+    def size(self):
+        return self.automaton1.size() * self.automaton2.size()
+
+    def start_mask(self) -> np.ndarray:
+        return np.kron(self.automaton1.start_mask(), self.automaton2.start_mask())
+
+    def final_mask(self) -> np.ndarray:
+        return np.kron(self.automaton1.final_mask(), self.automaton2.final_mask())
+
+    def start_indices(self) -> np.ndarray:
+        n2 = self.automaton2.size()
+        starts1, starts2 = (
+            self.automaton1.start_indices(),
+            self.automaton2.start_indices(),
+        )
+        return np.sort((starts1[:, None] * n2 + starts2[None, :]).ravel())
+
+    def final_indices(self) -> np.ndarray:
+        n2 = self.automaton2.size()
+        finals1, finals2 = (
+            self.automaton1.final_indices(),
+            self.automaton2.final_indices(),
+        )
+        return np.sort((finals1[:, None] * n2 + finals2[None, :]).ravel())
+
+    def matrices(self, matrix_class_id="csr") -> dict:
+        """
+        Materialized ``kron(A_l, B_l)`` for every common label ``l``, packed
+        into :class:`BitMatrix` if either factor is one.
+        """
+        result = dict()
+        for label in self.labels():
+            a = self.automaton1.transitions[label]
+            b = self.automaton2.transitions[label]
+            result[label] = kron(_as_csr(a), _as_csr(b), matrix_class_id)
+            if isinstance(a, BitMatrix) or isinstance(b, BitMatrix):
+                result[label] = BitMatrix(result[label])
+        return result
+
+    def reachable_from(
+        self, sources: np.ndarray, stats: dict = None, max_iterations: int = None
+    ):
+        """
+        Same as :func:`reachable_from` over the materialized intersection. The
+        search runs in the matrix class of ``automaton1`` transitions.
+        """
+        n1, n2, r = self.automaton1.size(), self.automaton2.size(), len(sources)
+        if stats is not None:
+            stats["iterations"], stats["front_sizes"] = 0, []
+        if r == 0 or n1 * n2 == 0:
+            return csr_matrix((r, n1 * n2), dtype=bool)
+        matrix_class = _matrix_class(self.automaton1)
+        steps = [
+            (
+                _as_class(self.automaton1.transitions[label].T, matrix_class),
+                _as_class(
+                    kron(
+                        identity(r, dtype=bool, format="csr"),
+                        _as_csr(self.automaton2.transitions[label]),
+                        format="csr",
+                    ),
+                    matrix_class,
+                ),
+            )
+            for label in self.labels()
+        ]
+        empty = _as_class(csr_matrix((n1, r * n2), dtype=bool), matrix_class)
+
+        def step(front):
+            return sum((a_t @ front @ b for a_t, b in steps), empty)
+
+        front = step(
+            _as_class(
+                bool_matrix(
+                    sources // n2, np.arange(r) * n2 + sources % n2, (n1, r * n2)
+                ),
+                matrix_class,
+            )
+        )
+        visited = front
+        front_sizes = [front.nnz]
+        while front.nnz > 0 and len(front_sizes) - 1 != max_iterations:
+            front = step(front) > visited
+            visited = visited + front
+            front_sizes.append(front.nnz)
+        if stats is not None:
+            stats["iterations"] = len(front_sizes) - 1
+            stats["front_sizes"] = front_sizes
+
+        i, col = visited.nonzero()
+        return bool_matrix(col // n2, i * n2 + col % n2, (r, n1 * n2))
+
+
 def intersect_automata(
     automaton1: FiniteAutomaton,
     automaton2: FiniteAutomaton,
     matrix_class_id="csr",
     is_graph=True,
-) -> FiniteAutomaton:
+    lazy=False,
+) -> FiniteAutomaton | ProductAutomaton:
+    product = ProductAutomaton(automaton1, automaton2)
+    if lazy:
+        return product
     automaton1.is_deterministic = not is_graph
     automaton2.is_deterministic = not is_graph
-    labels = automaton1.labels() & automaton2.labels()
-    transitions = dict()
-    start_states = set()
-    final_states = set()
-    states_mapping = dict()
-
-    for label in labels:
-        transitions[label] = kron(
-            automaton1.transitions[label],
-            automaton2.transitions[label],
-            matrix_class_id,
-        )
+    # product state k is State(k), made only if the state attributes are read
+    return FiniteAutomaton.from_indices(
+        product.matrices(matrix_class_id),
+        np.arange(product.size()),
+        product.start_indices(),
+        product.final_indices(),
+    )
 
-    for u, i in automaton1.states_mapping.items():
-        for v, j in automaton2.states_mapping.items():
-            k = len(automaton2.states_mapping) * i + j
-            states_mapping[State(k)] = k
 
-            if u in automaton1.start_states and v in automaton2.start_states:
-                start_states.add(State(k))
+# paths_ends runs frontier BFS from start product states instead of the
+# all-pairs closure while |start nodes| <= BFS_START_RATIO * |graph nodes|.
+# benchmarks/paths_ends_crossover.py on 1000-node graphs, regex "a* b*": the
+# closure wins from 0.02 on two cycles, from 0.75 on scale-free and never on
+# binomial graphs; 0.5 keeps "auto" within 2.5x of the faster strategy on all
+BFS_START_RATIO = 0.5
+
+
+def reachable_from(
+    automaton: FiniteAutomaton | ProductAutomaton,
+    sources: np.ndarray,
+    stats: dict = None,
+    max_iterations: int = None,
+):
+    """
+    Multi-source frontier BFS: row ``r`` of the result marks states reachable
+    from ``sources[r]`` by a non-empty path, as the same rows of the closure do.
+
+    The search stops after ``max_iterations`` if given. The number of
+    iterations and the front size (nnz) on every iteration, the last one left
+    unexplored if the search was stopped, are stored in ``stats`` dict if given.
+    """
+    if isinstance(automaton, ProductAutomaton):
+        return automaton.reachable_from(sources, stats, max_iterations)
+    if stats is not None:
+        stats["iterations"], stats["front_sizes"] = 0, []
+    if len(automaton.transitions) == 0:
+        return csr_matrix((len(sources), automaton.size()), dtype=bool)
+    adj = sum(
+        (_as_csr(matrix) for matrix in automaton.transitions.values()),
+        csr_matrix((automaton.size(), automaton.size()), dtype=bool),
+    )
+    front = adj[sources]
+    visited = front
+    front_sizes = [front.nnz]
+    while front.nnz > 0 and len(front_sizes) - 1 != max_iterations:
+        front = (front @ adj) > visited
+        visited = visited + front
+        front_sizes.append(front.nnz)
+    if stats is not None:
+        stats["iterations"] = len(front_sizes) - 1
+        stats["front_sizes"] = front_sizes
+    return visited
+
+
+def paths_ends_arrays(
+    graph: MultiDiGraph | GraphMatrices,
+    start_nodes: set[int],
+    final_nodes: set[int],
+    regex: str,
+    matrix_class=csr_matrix,
+    matrix_class_id="csr",
+    strategy: str = "auto",
+    bfs_ratio: float = None,
+    stats: dict = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Same query as :func:`paths_ends`, returns unique pairs as two aligned
+    arrays of source and target graph nodes.
+
+    ``strategy`` is ``"bfs"`` (frontier BFS from start product states only),
+    ``"closure"`` (all-pairs transitive closure, then filtering) or ``"auto"``,
+    which picks BFS while the start set is at most ``bfs_ratio`` of the graph
+    (``BFS_START_RATIO`` by default).
+    The chosen strategy is stored in ``stats`` dict if given.
+    """
+    graph = graph_to_matrices(graph)
+    graph_nfa = graph_to_mat(graph, start_nodes, final_nodes, matrix_class=matrix_class)
+    regex_dfa = regex_to_mat(regex, matrix_class=matrix_class)
+    dfa_size = regex_dfa.size()
+
+    # product state k is (graph state k // dfa_size, dfa state k % dfa_size)
+    product = intersect_automata(graph_nfa, regex_dfa, lazy=True)
+    start_states = product.start_indices()
+
+    def is_start(states):
+        return (
+            graph_nfa.start_mask()[states // dfa_size]
+            & regex_dfa.start_mask()[states % dfa_size]
+        )
 
-            if u in automaton1.final_states and v in automaton2.final_states:
-                final_states.add(State(k))
+    def is_final(states):
+        return (
+            graph_nfa.final_mask()[states // dfa_size]
+            & regex_dfa.final_mask()[states % dfa_size]
+        )
 
-    return FiniteAutomaton(transitions, start_states, final_states, states_mapping)
+    if strategy == "auto":
+        bfs_ratio = BFS_START_RATIO if bfs_ratio is None else bfs_ratio
+        small = len(graph_nfa.start_indices()) <= bfs_ratio * graph.size()
+        strategy = "bfs" if small else "closure"
+    if strategy == "bfs":
+        sources, cols = reachable_from(product, start_states).nonzero()
+        rows = start_states[sources]
+    elif strategy == "closure":
+        closure = transitive_closure(FiniteAutomaton(product.matrices(matrix_class_id)))
+        rows, cols = closure.nonzero()
+        keep = is_start(rows)
+        rows, cols = rows[keep], cols[keep]
+    else:
+        raise ValueError(f"Unknown paths_ends strategy: {strategy}")
+
+    if stats is not None:
+        stats["strategy"] = strategy
+        stats["start_states"] = len(start_states)
+        stats["product_states"] = product.size()
+
+    keep = is_final(cols)
+    empty_paths = start_states[is_final(start_states)]
+    rows = np.concatenate((empty_paths, rows[keep])) // dfa_size
+    cols = np.concatenate((empty_paths, cols[keep])) // dfa_size
+
+    pairs = np.unique(rows * graph.size() + cols)
+    return graph.nodes[pairs // graph.size()], graph.nodes[pairs % graph.size()]
 
 
 def paths_ends(
-    graph: MultiDiGraph,
+    graph: MultiDiGraph | GraphMatrices,
     start_nodes: set[int],
     final_nodes: set[int],
     regex: str,
-    matrix_class=dok_matrix,
+    matrix_class=csr_matrix,
     matrix_class_id="csr",
+    strategy: str = "auto",
+    bfs_ratio: float = None,
+    stats: dict = None,
 ) -> list[tuple[object, object]]:
-    graph_nfa = nfa_to_mat(
-        graph_to_nfa(graph, start_nodes, final_nodes), matrix_class=matrix_class
+    sources, targets = paths_ends_arrays(
+        graph,
+        start_nodes,
+        final_nodes,
+        regex,
+        matrix_class,
+        matrix_class_id,
+        strategy=strategy,
+        bfs_ratio=bfs_ratio,
+        stats=stats,
     )
-    regex_dfa = nfa_to_mat(regex_to_dfa(regex), matrix_class=matrix_class)
-
-    intersection = intersect_automata(
-        graph_nfa, regex_dfa, matrix_class_id=matrix_class_id, is_graph=False
-    )
-    closure = transitive_closure(intersection)
-    mapping = {v: i for i, v in graph_nfa.states_mapping.items()}
-    result = []
-    for u, v in zip(*closure.nonzero()):
-        if (
-            State(u) in intersection.start_states
-            and State(v) in intersection.final_states
-        ):
-            result.append(
-                (mapping[u // regex_dfa.size()], mapping[v // regex_dfa.size()])
-            )
-
-    return result
+    return list(zip(sources.tolist(), targets.tolist()))
@@ -1,55 +1,78 @@
-from scipy.sparse import dok_matrix, block_diag
+from scipy.sparse import csr_matrix, identity, kron
 
-from project.task3 import FiniteAutomaton
+from project.task2 import bool_matrix
+from project.task3 import FiniteAutomaton, _as_class, _as_csr, _matrix_class
 
 
 def reachability_with_constraints(
-    automaton: FiniteAutomaton, constraint_automaton: FiniteAutomaton
+    automaton: FiniteAutomaton,
+    constraint_automaton: FiniteAutomaton,
+    stats: dict = None,
 ) -> dict[int, set[int]]:
-    m, n = constraint_automaton.size(), automaton.size()
+    """
+    Multi-source BFS over the product of ``automaton`` and ``constraint_automaton``.
 
-    def get_front(start_state_index):
-        front = dok_matrix((m, m + n), dtype=bool)
-        for i in constraint_automaton.start_indices():
-            front[i, i] = True
-        for i in range(m):
-            front[i, start_state_index + m] = True
-        return front
-
-    def diag(mat):
-        result = dok_matrix(mat.shape, dtype=bool)
-        for i in range(mat.shape[0]):
-            for j in range(mat.shape[0]):
-                if mat[j, i]:
-                    result[i] += mat[j]
+    Fronts of all ``k`` start vertices are stacked into one ``(k * m, n)`` matrix:
+    row ``s * m + i`` holds graph vertices reachable from start ``s`` while the
+    constraint is in state ``i``. The identity block over constraint states of
+    the classic ``(m, m + n)`` front is implicit in this row layout.
+
+    Only pairs not visited before are propagated, and the search stops once
+    the front is empty. The search runs in the matrix class of ``automaton``
+    transitions. If ``stats`` dict is given, the number of iterations and the
+    front size (nnz) on every iteration are stored in it.
+    """
+    m, n = constraint_automaton.size(), automaton.size()
+    nodes = automaton.state_values()
+    starts = automaton.start_indices()
+    result = {v: set() for v in nodes[starts].tolist()}
+    k = len(starts)
+    if k == 0 or m == 0:
+        if stats is not None:
+            stats["iterations"], stats["front_sizes"] = 0, []
         return result
 
     common_labels = automaton.labels() & constraint_automaton.labels()
-    result = {s: set() for s in automaton.start_states}
-    adj = {
-        label: block_diag(
-            (constraint_automaton.transitions[label], automaton.transitions[label])
+    matrix_class = _matrix_class(automaton)
+    # (I_k x A^T) moves rows between constraint states inside every start block
+    steps = [
+        (
+            _as_class(
+                kron(
+                    identity(k, dtype=bool, format="csr"),
+                    _as_csr(constraint_automaton.transitions[label].T),
+                    format="csr",
+                ),
+                matrix_class,
+            ),
+            _as_class(automaton.transitions[label], matrix_class),
         )
         for label in common_labels
-    }
-
-    for v in automaton.start_indices():
-        front = get_front(v)
-        last_hash = -1
-        for _ in range(m * n):
-            front = sum(
-                [dok_matrix((m, m + n), dtype=bool)]
-                + [diag(front @ adj[label]) for label in common_labels]
-            )
-            fr = front[:, m:].nonzero()
-            for a, b in zip(fr[0], fr[1]):
-                if (
-                    a in constraint_automaton.final_indices()
-                    and b in automaton.final_indices()
-                ):
-                    result[v].add(b)
-                if hash(str(fr)) == last_hash:
-                    break
-                last_hash = hash(str(fr))
+    ]
+    empty = _as_class(csr_matrix((k * m, n), dtype=bool), matrix_class)
+
+    rows, cols = [], []
+    for s, v in enumerate(starts):
+        for i in constraint_automaton.start_indices():
+            rows.append(s * m + i)
+            cols.append(v)
+    front = _as_class(bool_matrix(rows, cols, (k * m, n)), matrix_class)
+    visited = front
+    front_sizes = [front.nnz]
+
+    while front.nnz > 0:
+        front = sum((move @ (front @ graph) for move, graph in steps), empty) > visited
+        visited = visited + front
+        front_sizes.append(front.nnz)
+
+    if stats is not None:
+        stats["iterations"] = len(front_sizes) - 1
+        stats["front_sizes"] = front_sizes
+
+    rows, cols = visited.nonzero()
+    final = constraint_automaton.final_mask()[rows % m] & automaton.final_mask()[cols]
+    sources = nodes[starts[rows[final] // m]].tolist()
+    for source, target in zip(sources, nodes[cols[final]].tolist()):
+        result[source].add(target)
 
     return result
@@ -0,0 +1,218 @@
+import json
+import pathlib
+import time
+
+import numpy as np
+from networkx import MultiDiGraph
+from scipy.optimize import nnls
+
+from project.task2 import GraphMatrices, graph_to_matrices
+from project.task3 import (
+    FiniteAutomaton,
+    ProductAutomaton,
+    graph_to_mat,
+    paths_ends_arrays,
+    reachable_from,
+    regex_to_mat,
+)
+from project.task4 import reachability_with_constraints
+
+# seconds per unit of every work term, see estimate_work; fitted by calibrate()
+# on two-cycles (300-10k nodes), scale-free (300-3k) and random graphs with
+# 1.5 and 3 edges per node (300-300k)
+COST_MODEL = {
+    "closure": {"pairs": 2.8e-7},
+    "bfs": {"iterations": 2.8e-4, "visits": 2.1e-7, "nodes": 2.8e-7},
+    "reachability": {"iterations": 2.7e-4, "visits": 2.3e-7, "nodes": 1.8e-8},
+}
+
+# start nodes (and product states for the closure) the probe BFS of
+# estimate_work is run from, and the iterations it is allowed; every iteration
+# costs about the product size, so large products get fewer of them, down to
+# PROBE_STATES // product size (at least 2)
+PROBE_SAMPLES = 16
+PROBE_ITERATIONS = 32
+PROBE_STATES = 2_000_000
+
+
+def _probe(product: ProductAutomaton, sources: np.ndarray) -> tuple[float, float]:
+    """
+    Mean number of states reached from ``sources`` and BFS iterations. A probe
+    cut off after ``PROBE_ITERATIONS`` (fewer on products larger than
+    ``PROBE_STATES``) is extrapolated: its front is assumed to keep changing
+    by its mean ratio per iteration, so a shrinking front adds a geometric
+    series of states and any other one keeps going for at most
+    ``PROBE_ITERATIONS`` more iterations. A front that never changed its size
+    (a path or a cycle) reaches the whole product.
+    """
+    stats = dict()
+    limit = min(PROBE_ITERATIONS, max(2, PROBE_STATES // max(product.size(), 1)))
+    reached = reachable_from(product, sources, stats, limit)
+    count = max(len(sources), 1)
+    reach, iterations = reached.nnz / count, stats["iterations"]
+    sizes = stats["front_sizes"]
+    if sizes and sizes[-1] > 0:
+        rest, front = product.size() - reach, sizes[-1] / count
+        growth = (sizes[-1] / sizes[0]) ** (1 / stats["iterations"])
+        if min(sizes) == max(sizes):
+            # a path or a cycle: the front moves on until the product ends
+            iterations += rest / max(front, 1)
+            reach = product.size()
+        elif growth < 1:
+            reach += min(rest, front * growth / (1 - growth))
+            iterations += np.log(max(front, 1)) / -np.log(growth) + 1
+        elif growth == 1:
+            reach += min(rest, front * PROBE_ITERATIONS)
+            iterations += PROBE_ITERATIONS
+        else:
+            # front * (growth + growth^2 + ... + growth^m) = rest
+            steps = np.log1p(rest * (growth - 1) / (front * growth)) / np.log(growth)
+            steps = min(steps, PROBE_ITERATIONS)
+            reach += min(rest, front * growth * (growth**steps - 1) / (growth - 1))
+            iterations += steps
+    return reach + 1, iterations
+
+
+def estimate_work(
+    graph: GraphMatrices, dfa: FiniteAutomaton, start_indices: np.ndarray
+) -> dict[str, dict[str, float]]:
+    """
+    Work terms of every plan for a query over ``graph`` from the graph states
+    ``start_indices`` with a regex ``dfa``.
+
+    The product is probed by a short BFS from a few sampled start nodes, which
+    gives the number of BFS ``iterations`` and the product edges scanned from
+    one start node (reached states times the mean out-degree of the product).
+    Both BFS plans pay for the ``visits`` of every start node, for graph-sized
+    arrays once per query (``nodes``) and for a few sparse products on every
+    iteration, each with its own coefficients. The all-pairs ``"closure"``
+    visits the edges reachable from every product state (``pairs``), probed
+    from a few random product states.
+    """
+    n, d = graph.size(), dfa.size()
+    product = ProductAutomaton(graph_to_mat(graph, set(), set()), dfa)
+    kron_nnz = sum(
+        product.automaton1.transitions[label].nnz * dfa.transitions[label].nnz
+        for label in product.labels()
+    )
+    degree = kron_nnz / max(n * d, 1) + 1
+
+    rng = np.random.default_rng(0)
+    sample = rng.choice(
+        start_indices, min(PROBE_SAMPLES, len(start_indices)), replace=False
+    )
+    reach, iterations = _probe(
+        product, (sample[:, None] * d + dfa.start_indices()[None, :]).ravel()
+    )
+    closure_reach, _ = _probe(
+        product, rng.choice(n * d, min(PROBE_SAMPLES, n * d), replace=False)
+    )
+    k = len(start_indices)
+    visits = k * reach * degree
+    return {
+        "closure": {"pairs": n * d * closure_reach * degree},
+        "bfs": {"iterations": iterations, "visits": visits, "nodes": n},
+        "reachability": {"iterations": iterations, "visits": visits, "nodes": n},
+    }
+
+
+def rpq(
+    graph: MultiDiGraph | GraphMatrices,
+    start_nodes: set,
+    final_nodes: set,
+    regex: str,
+    cost_model: dict = None,
+    plan: str = None,
+    log_path=None,
+    stats: dict = None,
+) -> set[tuple[object, object]]:
+    """
+    Regular path query planner: returns pairs ``(start, final)`` connected by a
+    path labeled by a word of ``regex``, whatever engine answers it.
+
+    The plan with the least estimated cost is run unless ``plan`` is given.
+    Empty ``start_nodes``/``final_nodes`` mean all graph nodes. The chosen plan,
+    all estimates and the actual time are stored in ``stats`` dict and
+    appended as a JSON line to ``log_path`` if given.
+    """
+    graph = graph_to_matrices(graph)
+    dfa = regex_to_mat(regex)
+    start_indices = (
+        np.unique(graph.indices(start_nodes))
+        if start_nodes
+        else np.arange(graph.size())
+    )
+    cost_model = COST_MODEL if cost_model is None else cost_model
+    work = estimate_work(graph, dfa, start_indices)
+    estimates = {
+        plan: sum(cost_model[plan][term] * value for term, value in terms.items())
+        for plan, terms in work.items()
+    }
+    if plan is None:
+        plan = min(estimates, key=estimates.get)
+
+    begin = time.perf_counter()
+    if plan in ("closure", "bfs"):
+        sources, targets = paths_ends_arrays(
+            graph, start_nodes, final_nodes, regex, strategy=plan
+        )
+        result = set(zip(sources.tolist(), targets.tolist()))
+    elif plan == "reachability":
+        ends = reachability_with_constraints(
+            graph_to_mat(graph, start_nodes, final_nodes), dfa
+        )
+        result = {(start, end) for start, targets in ends.items() for end in targets}
+    else:
+        raise ValueError(f"Unknown query plan: {plan}")
+    elapsed = time.perf_counter() - begin
+
+    record = {
+        "plan": plan,
+        "work": work,
+        "estimates": estimates,
+        "actual": elapsed,
+        "nodes": graph.size(),
+        "nnz": graph.number_of_edges(),
+        "dfa_size": dfa.size(),
+        "start_count": len(start_indices),
+    }
+    if stats is not None:
+        stats.update(record)
+    if log_path is not None:
+        with open(log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    return result
+
+
+def calibrate(log_path, cost_model: dict = None) -> dict[str, dict[str, float]]:
+    """
+    Refits ``COST_MODEL`` coefficients from a query log written by :func:`rpq`:
+    non-negative least squares of actual time over the work terms of every
+    plan, with residuals scaled by the square root of the time, so neither
+    the slowest nor the fastest queries dominate. Plans missing in the log
+    keep their coefficients.
+    """
+    cost_model = {
+        plan: dict(terms)
+        for plan, terms in (COST_MODEL if cost_model is None else cost_model).items()
+    }
+    samples = dict()
+    with open(pathlib.Path(log_path)) as f:
+        for line in f:
+            record = json.loads(line)
+            plan = record["plan"]
+            samples.setdefault(plan, []).append(
+                (record["work"][plan], record["actual"])
+            )
+
+    for plan, pairs in samples.items():
+        terms = sorted(cost_model[plan])
+        work = np.array([[w[term] for term in terms] for w, _ in pairs], dtype=float)
+        actual = np.array([a for _, a in pairs])
+        if not (work > 0).any():
+            continue
+        scale = 1 / np.sqrt(np.maximum(actual, 1e-9))
+        coefficients, _ = nnls(work * scale[:, None], actual * scale)
+        cost_model[plan] = dict(zip(terms, coefficients.tolist()))
+    return cost_model
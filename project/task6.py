@@ -1,10 +1,14 @@
+import hashlib
 import pyformlang
 from typing import Set, Tuple
 from pyformlang.cfg import *
 import networkx as nx
+import numpy as np
+from project.cache import CompileCache
+from project.task2 import GraphMatrices, graph_to_matrices
 
 
-def cfg_to_weak_normal_form(cfg: pyformlang.cfg.CFG) -> pyformlang.cfg.CFG:
+def _weak_normal_form(cfg: pyformlang.cfg.CFG) -> pyformlang.cfg.CFG:
     cfg = cfg.eliminate_unit_productions().remove_useless_symbols()
 
     new_productions = cfg._get_productions_with_only_single_terminals()
@@ -22,67 +26,206 @@ def extract(g):
     for p in g.productions:
         if len(p.body) == 1 and isinstance(p.body[0], Terminal):
             k_1.setdefault(p.head, set()).add(p.body[0])
-        elif len(p.body) == 1 and isinstance(p.body[0], Epsilon):
-            k_2.add(p.body[0])
+        elif len(p.body) == 0 or (len(p.body) == 1 and isinstance(p.body[0], Epsilon)):
+            k_2.add(p.head)
         elif len(p.body) == 2:
             k_3.setdefault(p.head, set()).add((p.body[0], p.body[1]))
 
     return k_1, k_2, k_3
 
 
-def extract_r(cfg, graph, p1, p2):
-    r = {(N_i, v, v) for N_i in p2 for v in graph.nodes}
-    r |= {
-        (N_i, v, u)
-        for (v, u, tag) in graph.edges.data("label")
-        for N_i in p1
-        if tag in p1[N_i]
-    }
-    return r
+class NormalizedGrammar:
+    """Weak normal form of a grammar and its ``extract`` production indices."""
+
+    def __init__(self, cfg: CFG):
+        self.cfg = _weak_normal_form(cfg)
+        self.extracted = extract(self.cfg)
+
+
+class GrammarCache(CompileCache):
+    """
+    Normalized grammars keyed by a canonical hash of the start symbol and the
+    sorted productions, so equal grammars written differently share an entry.
+    """
+
+    def key(self, cfg: CFG) -> str:
+        productions = sorted(
+            repr(p.head) + " -> " + " ".join(map(repr, p.body)) for p in cfg.productions
+        )
+        text = "\n".join([repr(cfg.start_symbol)] + productions)
+        return hashlib.sha256(text.encode()).hexdigest()
 
+    def build(self, cfg: CFG) -> NormalizedGrammar:
+        return NormalizedGrammar(cfg)
 
-def compute_r(m, r, p3):
-    while len(m) > 0:
-        N_i, v, u = m.pop()
 
-        r_tmp = set()
-        for N_j, v_, u_ in r:
-            if v == u_:
-                for N_k in p3:
-                    if (N_j, N_i) in p3[N_k] and (N_k, v_, v) not in r:
-                        m.add((N_k, v_, u))
-                        r_tmp.add((N_k, v_, u))
-        r |= r_tmp
+GRAMMAR_CACHE = GrammarCache(maxsize=64)
+
+
+def cfg_to_weak_normal_form(cfg: pyformlang.cfg.CFG) -> pyformlang.cfg.CFG:
+    return GRAMMAR_CACHE.get(cfg).cfg
+
+
+def nonterminals_index(p1, p2, p3) -> dict:
+    """Dense ids of all nonterminals of the extracted productions."""
+    variables = list(p1) + list(p2)
+    for N_k, bodies in p3.items():
+        variables.append(N_k)
+        for body in bodies:
+            variables.extend(body)
+    return {N: i for i, N in enumerate(dict.fromkeys(variables))}
+
+
+def extract_r(cfg, graph: GraphMatrices, p1, p2, index) -> dict[int, np.ndarray]:
+    """
+    Initial triples ``(N, v, u)``: for every nonterminal id ``N`` a sorted
+    array of packed vertex pairs ``v * n + u`` over graph vertex indices.
+    """
+    n = graph.size()
+    r = {i: np.zeros(0, dtype=np.int64) for i in index.values()}
+    for N_i in p2:
+        r[index[N_i]] = np.arange(n, dtype=np.int64) * (n + 1)
+    for label, mat in graph.transitions.items():
+        rows, cols = mat.nonzero()
+        keys = rows.astype(np.int64) * n + cols
+        for N_i in p1:
+            if Terminal(label) in p1[N_i]:
+                r[index[N_i]] = np.union1d(r[index[N_i]], keys)
     return r
 
 
-def filter_results(r, start_nodes, final_nodes, cfg):
-    filtered_results = set()
-    for N_i, v, u in r:
-        if v in start_nodes and u in final_nodes and Variable(N_i) == cfg.start_symbol:
-            filtered_results.add((v, u))
-    return filtered_results
+# pairs a single slice of _compose may produce before known pairs are dropped
+COMPOSE_CHUNK = 1 << 18
+
+
+class _PairRuns:
+    """
+    Set of packed pairs kept as disjoint sorted runs of decreasing length. A
+    new run is merged only with the last runs not longer than it, so every
+    pair is copied O(log) times overall instead of once per round.
+    """
+
+    def __init__(self, keys: np.ndarray):
+        self.runs = [keys] if len(keys) else []
+
+    def add(self, keys: np.ndarray):
+        """Adds sorted unique ``keys`` none of which are in the set yet."""
+        while self.runs and len(self.runs[-1]) <= len(keys):
+            keys = np.union1d(self.runs.pop(), keys)
+        self.runs.append(keys)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self.runs:
+            found |= run[np.minimum(np.searchsorted(run, keys), len(run) - 1)] == keys
+        return found
+
+    def array(self) -> np.ndarray:
+        return np.sort(np.concatenate([np.zeros(0, dtype=np.int64)] + self.runs))
+
+
+def _compose(
+    left: np.ndarray,
+    right: np.ndarray,
+    n: int,
+    known: _PairRuns,
+    chunk: int = None,
+) -> np.ndarray:
+    """
+    Packed pairs ``(v, u)`` not in ``known`` with ``(v, w)`` in ``left`` and
+    ``(w, u)`` in sorted ``right``. ``left`` is joined in slices of about
+    ``chunk`` produced pairs (``COMPOSE_CHUNK`` by default) and known pairs are
+    dropped from every slice, so only the new pairs are kept.
+    """
+    if len(left) == 0 or len(right) == 0:
+        return np.zeros(0, dtype=np.int64)
+    chunk = COMPOSE_CHUNK if chunk is None else chunk
+    middle = left % n
+    begin = np.searchsorted(right, middle * n)
+    counts = np.searchsorted(right, (middle + 1) * n) - begin
+    ends = np.cumsum(counts)
+    bounds = np.searchsorted(ends, np.arange(chunk, ends[-1], chunk), side="right")
+
+    new = [np.zeros(0, dtype=np.int64)]
+    for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(left)]):
+        part = counts[lo:hi]
+        offsets = np.repeat(begin[lo:hi] - np.cumsum(part) + part, part)
+        joined = right[offsets + np.arange(part.sum())]
+        joined = np.unique(np.repeat(left[lo:hi] // n, part) * n + joined % n)
+        new.append(joined[~known.contains(joined)])
+    return np.unique(np.concatenate(new))
+
+
+def compute_r(m, r, p3, n: int):
+    """
+    Hellings fixpoint over integer-encoded triples, with the worklist ``m``
+    processed a batch at a time: on every round, productions ``A -> B C`` with
+    new pairs of ``B`` or ``C`` (``m``) join them with all pairs of the other
+    one, and pairs not yet in ``r[A]`` become the next worklist. ``p3`` holds
+    ``(A, B, C)`` nonterminal ids.
+    """
+    # body nonterminal -> productions it occurs in
+    by_body = {}
+    for production in p3:
+        for N in set(production[1:]):
+            by_body.setdefault(N, []).append(production)
+
+    pairs = {N: _PairRuns(keys) for N, keys in r.items()}
+    m = {N: delta for N, delta in m.items() if len(delta)}
+    while m:
+        found = {}
+        for A, B, C in {p for N in m for p in by_body.get(N, ())}:
+            parts = found.setdefault(A, [np.zeros(0, dtype=np.int64)])
+            if B in m:
+                parts.extend(_compose(m[B], run, n, pairs[A]) for run in pairs[C].runs)
+            if C in m:
+                parts.extend(_compose(run, m[C], n, pairs[A]) for run in pairs[B].runs)
+
+        m = dict()
+        for A, parts in found.items():
+            new = np.unique(np.concatenate(parts))
+            if len(new):
+                m[A] = new
+                pairs[A].add(new)
+    return {N: runs.array() for N, runs in pairs.items()}
+
+
+def filter_results(r, start_nodes, final_nodes, cfg, index, nodes: np.ndarray):
+    """Decodes pairs of the start nonterminal between start and final nodes."""
+    start = index.get(cfg.start_symbol)
+    if start is None:
+        return set()
+    n = len(nodes)
+    sources, targets = r[start] // n, r[start] % n
+    keep = np.isin(nodes[sources], list(start_nodes)) & np.isin(
+        nodes[targets], list(final_nodes)
+    )
+    return set(zip(nodes[sources[keep]].tolist(), nodes[targets[keep]].tolist()))
 
 
 def cfpq_with_hellings(
     cfg: CFG,
-    graph: nx.DiGraph,
+    graph: nx.DiGraph | GraphMatrices,
     start_nodes: Set[int] = None,
     final_nodes: Set[int] = None,
 ) -> Set[Tuple[int, int]]:
+    graph = graph_to_matrices(graph)
     if start_nodes is None:
-        start_nodes = graph.nodes
+        start_nodes = set(graph.nodes.tolist())
     if final_nodes is None:
-        final_nodes = graph.nodes
+        final_nodes = set(graph.nodes.tolist())
 
-    g = cfg_to_weak_normal_form(cfg)
-    k_1, k_2, k_3 = extract(g)
+    k_1, k_2, k_3 = GRAMMAR_CACHE.get(cfg).extracted
+    index = nonterminals_index(k_1, k_2, k_3)
+    productions = [(index[N_k], index[B], index[C]) for N_k in k_3 for B, C in k_3[N_k]]
 
-    r = extract_r(cfg, graph, k_1, k_2)
+    r = extract_r(cfg, graph, k_1, k_2, index)
 
-    m = r.copy()
+    m = dict(r)
 
-    r = compute_r(m, r, k_3)
+    r = compute_r(m, r, productions, graph.size())
 
-    filtered_results = filter_results(r, start_nodes, final_nodes, cfg)
+    filtered_results = filter_results(
+        r, start_nodes, final_nodes, cfg, index, graph.nodes
+    )
     return filtered_results
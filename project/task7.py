@@ -1,52 +1,90 @@
-from scipy.sparse import lil_matrix
+from scipy.sparse import csr_matrix, identity
 from pyformlang.cfg import CFG, Terminal
 import networkx as nx
 from typing import Set, Tuple
+from project.task2 import GraphMatrices, graph_to_matrices
 from project.task6 import cfg_to_weak_normal_form
 
 
 def cfpq_with_matrix(
     cfg: CFG,
-    graph: nx.DiGraph,
+    graph: nx.DiGraph | GraphMatrices,
     start_nodes: Set[int] = None,
     final_nodes: Set[int] = None,
+    stats: dict = None,
 ) -> Set[Tuple[int, int]]:
+    """
+    Matrix CFPQ: boolean matrix of every nonterminal of the weak normal form
+    is closed under binary productions. If ``stats`` dict is given, the number
+    of semi-naive rounds is stored in it.
+    """
+    graph = graph_to_matrices(graph)
     cfg = cfg_to_weak_normal_form(cfg)
     nonterminals = {prod.head for prod in cfg.productions}
     variable_indices = {var: idx for idx, var in enumerate(nonterminals)}
-    num_vertices = graph.number_of_nodes()
+    num_vertices = graph.size()
+
+    # terminal -> nonterminals deriving it, every nonterminal matrix starts
+    # as the OR of the label matrices of its terminals
+    by_terminal = dict()
+    for production in cfg.productions:
+        if len(production.body) == 1 and isinstance(production.body[0], Terminal):
+            by_terminal.setdefault(str(production.body[0].value), set()).add(
+                production.head
+            )
 
     adj_matrices = {
-        var: lil_matrix((num_vertices, num_vertices), dtype=bool)
+        var: csr_matrix((num_vertices, num_vertices), dtype=bool)
         for var in nonterminals
     }
+    for label, edges in graph.transitions.items():
+        for var in by_terminal.get(str(label), ()):
+            adj_matrices[var] = adj_matrices[var] + edges
+
+    for production in cfg.productions:
+        if len(production.body) == 0:
+            adj_matrices[production.head] = adj_matrices[production.head] + identity(
+                num_vertices, dtype=bool, format="csr"
+            )
+
+    # semi-naive evaluation: only products with a new fact of the previous
+    # round (delta) can give new facts, A' = A + dB @ C + B @ dC
+    deltas = dict(adj_matrices)
+    binary = [
+        (production.head, *production.body)
+        for production in cfg.productions
+        if len(production.body) == 2
+        and all(var in variable_indices for var in production.body)
+    ]
+    iterations = 0
+    while any(delta.nnz > 0 for delta in deltas.values()):
+        iterations += 1
+        found = {
+            var: csr_matrix((num_vertices, num_vertices), dtype=bool)
+            for var in nonterminals
+        }
+        for head, B, C in binary:
+            if deltas[B].nnz > 0:
+                found[head] = found[head] + deltas[B] @ adj_matrices[C]
+            if deltas[C].nnz > 0:
+                found[head] = found[head] + adj_matrices[B] @ deltas[C]
+        deltas = {var: found[var] > adj_matrices[var] for var in nonterminals}
+        for var, delta in deltas.items():
+            if delta.nnz > 0:
+                adj_matrices[var] = adj_matrices[var] + delta
 
-    for edge in graph.edges(data=True):
-        for production in cfg.productions:
-            if len(production.body) == 1 and isinstance(production.body[0], Terminal):
-                if str(edge[2].get("label", "")) == str(production.body[0]):
-                    adj_matrices[production.head][edge[0], edge[1]] = True
-
-    changes = True
-    while changes:
-        changes = False
-        for production in cfg.productions:
-            if len(production.body) == 2:
-                A, B = production.body
-                if A in variable_indices and B in variable_indices:
-                    before = adj_matrices[production.head].nnz
-                    adj_matrices[production.head] += adj_matrices[A] * adj_matrices[B]
-                    after = adj_matrices[production.head].nnz
-                    if before != after:
-                        changes = True
+    if stats is not None:
+        stats["iterations"] = iterations
 
+    nodes = graph.nodes.tolist()
     result = set()
     for variable, matrix in adj_matrices.items():
         if variable == cfg.start_symbol:
             matrix = matrix.tocoo()
             for i, j in zip(matrix.row, matrix.col):
-                if (start_nodes is None or i in start_nodes) and (
-                    final_nodes is None or j in final_nodes
+                u, v = nodes[i], nodes[j]
+                if (start_nodes is None or u in start_nodes) and (
+                    final_nodes is None or v in final_nodes
                 ):
-                    result.add((i, j))
+                    result.add((u, v))
     return result
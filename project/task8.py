@@ -7,9 +7,9 @@ from pyformlang.finite_automaton import State, Symbol
 from pyformlang.regular_expression import Regex
 from pyformlang.rsa import Box
 from scipy.sparse import dok_matrix
+from project.task2 import GraphMatrices
 from pyformlang.cfg import CFG
 from pyformlang.rsa import RecursiveAutomaton
-from project.task2 import graph_to_nfa
 
 
 def cfg_to_rsm(cfg: CFG) -> RecursiveAutomaton:
@@ -74,7 +74,7 @@ def ebnf_to_rsm(ebnf: str) -> RecursiveAutomaton:
 
 def cfpq_with_tensor(
     rsm: pyformlang.rsa.RecursiveAutomaton,
-    graph: DiGraph,
+    graph: DiGraph | GraphMatrices,
     start_nodes: set[int] = None,
     final_nodes: set[int] = None,
 ) -> set[tuple[int, int]]:
@@ -94,6 +94,8 @@ def cfpq_with_tensor(
                 start_states.add(s)
             if state in a.dfa.final_states:
                 final_states.add(s)
+            if state in a.dfa.start_states and state in a.dfa.final_states:
+                null_symb.add(v)
 
     ls = len(states)
     states_map = {}
@@ -113,14 +115,14 @@ def cfpq_with_tensor(
                     sts_src = states_map[State((var, src.value))]
                     sts_target = states_map[State((var, target.value))]
                     m[label][sts_src, sts_target] = True
-                if isinstance(dst, Epsilon):
-                    null_symb.add(label)
 
     result = task3.FiniteAutomaton(m, start_states, final_states, states_map)
     result.epsilon_symbol = null_symb
     result.number_of_states = ls
 
-    graph_matrix = task3.nfa_to_mat(graph_to_nfa(graph, start_nodes, final_nodes))
+    graph_matrix = task3.graph_to_mat(
+        graph, start_nodes, final_nodes, matrix_class=dok_matrix
+    )
     mat = result
     graph_matrix_inds = graph_matrix.indices_dict()
     mat_idx = mat.indices_dict()
@@ -137,7 +139,7 @@ def cfpq_with_tensor(
     while cur != last:
         last = cur
         closure = task3.transitive_closure(
-            task3.intersect_automata(mat, graph_matrix)
+            task3.intersect_automata(mat, graph_matrix, lazy=True)
         ).nonzero()
         closure = list(zip(*closure))
         cur = len(closure)
@@ -153,13 +155,14 @@ def cfpq_with_tensor(
                 graph_matrix.transitions[var][i % n, j % n] = True
 
     result = set()
-    for _, matrix in graph_matrix.transitions.items():
-        non_zero_indices = matrix.nonzero()
-        for i, j in zip(*non_zero_indices):
-            if (
-                graph_matrix_inds[i] in mat.start_states
-                and graph_matrix_inds[j] in mat.final_states
-            ):
-                result.add((graph_matrix_inds[i], graph_matrix_inds[j]))
+    matrix = graph_matrix.transitions.get(rsm.initial_label)
+    if matrix is None:
+        return result
+    for i, j in zip(*matrix.nonzero()):
+        if (
+            graph_matrix_inds[i] in graph_matrix.start_states
+            and graph_matrix_inds[j] in graph_matrix.final_states
+        ):
+            result.add((graph_matrix_inds[i].value, graph_matrix_inds[j].value))
 
     return result
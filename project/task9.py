@@ -1,12 +1,6 @@
+from project.task2 import GraphMatrices, graph_to_matrices
 from project.task8 import cfg_to_rsm
 from pyformlang.cfg import CFG
-from pyformlang.finite_automaton import State
-from pyformlang.rsa import RecursiveAutomaton
-import networkx as nx
-from copy import deepcopy
-from project.task8 import cfg_to_rsm
-from pyformlang.cfg import CFG
-from pyformlang.finite_automaton import State
 from pyformlang.rsa import RecursiveAutomaton
 import networkx as nx
 from collections import deque
@@ -14,54 +8,86 @@ from collections import deque
 
 def cfpq_with_gll(
     automaton: RecursiveAutomaton,
-    digraph: nx.DiGraph,
+    digraph: nx.DiGraph | GraphMatrices,
     init_nodes: set[int] = None,
     end_nodes: set[int] = None,
 ) -> set[tuple[int, int]]:
     if isinstance(automaton, CFG):
         automaton = cfg_to_rsm(automaton)
 
+    graph = graph_to_matrices(digraph)
+    nodes = graph.nodes.tolist()
+
     if init_nodes is None:
-        init_nodes = set(digraph.nodes)
+        init_nodes = set(nodes)
 
     if end_nodes is None:
-        end_nodes = set(digraph.nodes)
+        end_nodes = set(nodes)
+
+    init_indices = set(graph.indices(init_nodes).tolist())
+    end_indices = set(graph.indices(end_nodes).tolist())
 
-    nonterm_start_rsm = (
-        automaton.initial_label.value
-        if automaton.initial_label.value is not None
-        else "S"
-    )
-    start_rsm = automaton.boxes[automaton.initial_label].dfa.start_state.value
+    boxes = {str(label): box.dfa for label, box in automaton.boxes.items()}
+    boxes_transitions = {var: dfa.to_dict() for var, dfa in boxes.items()}
+    start_var = str(automaton.initial_label)
+    if start_var not in boxes:
+        return set()
+
+    # GSS node is (nonterminal, vertex where its box was entered)
+    gss_edges = dict()
+    popped = dict()
 
     res = set()
     visited = set()
     queue = deque()
 
-    for sn in init_nodes:
-        queue.append((nonterm_start_rsm, sn, sn))
+    def add(descriptor):
+        if descriptor not in visited:
+            visited.add(descriptor)
+            queue.append(descriptor)
 
-    start_dfa = automaton.boxes[nonterm_start_rsm].dfa.to_dict()
-    start_dfa.setdefault(State(start_rsm), dict())
+    def gss_node(var, v):
+        node = (var, v)
+        if node not in gss_edges:
+            gss_edges[node] = set()
+            popped[node] = set()
+            add(((var, boxes[var].start_state), v, node))
+        return node
 
-    while queue:
-        current_nonterm, current_node, path_start = queue.popleft()
+    def call(var, v, return_state, caller):
+        callee = gss_node(var, v)
+        if (return_state, caller) not in gss_edges[callee]:
+            gss_edges[callee].add((return_state, caller))
+            for u in popped[callee]:
+                add((return_state, u, caller))
+
+    def pop(gss, v):
+        if v in popped[gss]:
+            return
+        popped[gss].add(v)
+        for return_state, caller in gss_edges[gss]:
+            add((return_state, v, caller))
 
-        if (current_node, (path_start, current_nonterm)) in visited:
-            continue
-        visited.add((current_node, (path_start, current_nonterm)))
+        var, path_start = gss
+        if var == start_var and path_start in init_indices and v in end_indices:
+            res.add((nodes[path_start], nodes[v]))
 
-        if current_node in end_nodes and current_nonterm == start_rsm:
-            res.add((path_start, current_node))
+    for v in init_indices:
+        gss_node(start_var, v)
+
+    while queue:
+        (var, state), v, gss = queue.popleft()
 
-        for symbol, _ in start_dfa.items():
-            if symbol in automaton.labels:
-                new_state = (current_nonterm, current_node, symbol.value)
-                if new_state not in visited:
-                    queue.append((symbol.value, current_node, path_start))
+        if state in boxes[var].final_states:
+            pop(gss, v)
 
-        for neighbor in digraph.neighbors(current_node):
-            if (current_nonterm, neighbor, path_start) not in visited:
-                queue.append((current_nonterm, neighbor, path_start))
+        for symbol, dst in boxes_transitions[var].get(state, dict()).items():
+            label = str(symbol)
+            if label in boxes:
+                call(label, v, (var, dst), gss)
+            if label in graph.transitions:
+                mat = graph.transitions[label]
+                for u in mat.indices[mat.indptr[v] : mat.indptr[v + 1]].tolist():
+                    add(((var, dst), u, gss))
 
     return res
@@ -1,6 +1,7 @@
 import pytest
 import project.task1 as pg
 from tempfile import NamedTemporaryFile
+from project.task2 import GraphMatrices
 
 
 def test_1_graph_info():
@@ -48,3 +49,41 @@ def test_3_two_cycles_graph():
     assert pg.graph_info(
         pg.create_two_cycles_graph(42, 29, ("f", "s"))
     ) == pg.GraphInfo(72, 73, {"f", "s"})
+
+
+def test_4_csv_to_matrices(tmp_path):
+    graph_original = pg.create_two_cycles_graph(3, 4, ("a", "b"))
+    csv_path = tmp_path / "graph.csv"
+    with open(csv_path, "w") as f:
+        for u, v, label in graph_original.edges(data="label"):
+            f.write(f"{u} {v} {label}\n")
+
+    info = pg.csv_to_matrices(csv_path, tmp_path / "matrices", chunksize=3)
+    assert info == pg.graph_stats(graph_original)
+    assert info.labels_count == {"a": 4, "b": 5}
+    assert not (tmp_path / "matrices" / "edges.tmp").exists()
+
+    matrices = GraphMatrices.load(tmp_path / "matrices")
+    assert set(matrices.edges()) == set(graph_original.edges(data="label"))
+
+
+def test_5_graph_stats_by_name(tmp_path, monkeypatch):
+    graph_original = pg.create_two_cycles_graph(3, 4, ("a", "b"))
+    csv_path = tmp_path / "graph.csv"
+    with open(csv_path, "w") as f:
+        for u, v, label in graph_original.edges(data="label"):
+            f.write(f"{u} {v} {label}\n")
+    downloads = []
+    monkeypatch.setattr(
+        pg.cfpq_data, "download", lambda name: downloads.append(name) or csv_path
+    )
+    monkeypatch.setenv(pg.GRAPH_CACHE_ENV, str(tmp_path / "cache"))
+
+    assert pg.get_graph_info_by_name("g") == pg.graph_info(graph_original)
+    assert pg.get_graph_stats_by_name("g") == pg.graph_stats(graph_original)
+    assert downloads == ["g"]
+    # only stats are stored, no matrices
+    assert [p.name for p in (tmp_path / "cache" / "g").iterdir()] == ["stats.json"]
+
+    pg.get_graph_info_by_name("g", refresh=True)
+    assert downloads == ["g", "g"]
@@ -1,6 +1,18 @@
+import numpy as np
+import pytest
+import scipy.sparse
 from pyformlang.finite_automaton import DeterministicFiniteAutomaton, State
-from project.task2 import regex_to_dfa, graph_to_nfa
+from project.bitmatrix import BitMatrix
+from project.task2 import (
+    GraphMatrices,
+    RegexCache,
+    regex_to_dfa,
+    graph_to_nfa,
+)
+from project.cache import CompileCache
 from project.task1 import create_two_cycles_graph
+from project.task3 import paths_ends
+from tempfile import NamedTemporaryFile
 
 
 def test_1():
@@ -20,3 +32,78 @@ def test_2():
     nfa = graph_to_nfa(create_two_cycles_graph(3, 3, ("1", "0")), [0], [0])
     dfa = regex_to_dfa("(1 1 1 1|0 0 0 0)*")
     assert dfa.is_equivalent_to(nfa)
+
+
+def test_graph_matrices_from_csv():
+    graph = create_two_cycles_graph(2, 3, ("a", "b"))
+    with NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+        for u, v, label in graph.edges(data="label"):
+            f.write(f"{u} {v} {label}\n")
+
+    from_csv = GraphMatrices.from_csv(f.name)
+    from_graph = GraphMatrices.from_networkx(graph)
+
+    assert set(from_csv.edges()) == set(from_graph.edges())
+    assert from_csv.size() == from_graph.size() == graph.number_of_nodes()
+
+
+def test_graph_matrices_paths_ends():
+    graph = create_two_cycles_graph(3, 2, ("a", "b"))
+    matrices = GraphMatrices.from_networkx(graph)
+
+    assert set(paths_ends(graph, {0}, {2, 4}, "a* b")) == {(0, 4)}
+    assert set(paths_ends(matrices, {0}, {2, 4}, "a* b")) == {(0, 4)}
+
+
+def test_graph_matrices_save_drops_explicit_zeros(tmp_path):
+    mat = scipy.sparse.csr_matrix(([True, False], ([0, 1], [1, 0])), shape=(2, 2))
+    assert mat.nnz == 2
+    GraphMatrices([0, 1], {"a": mat}).save(tmp_path)
+
+    assert set(GraphMatrices.load(tmp_path).edges()) == {(0, 1, "a")}
+    assert mat.nnz == 2
+
+
+def test_regex_cache(tmp_path):
+    with pytest.raises(TypeError):
+        CompileCache()
+
+    cache = RegexCache(maxsize=2, cache_dir=tmp_path)
+    first = cache.get("a*  b")
+    assert cache.get(" a* b ") is first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.get("c")
+    cache.get("d")
+    assert len(cache) == 2
+    assert cache.get("a* b") is not first
+    assert cache.get("a* b").dfa.is_equivalent_to(first.dfa)
+    assert len(list(tmp_path.iterdir())) == 3
+
+    dfa = regex_to_dfa("a* b")
+    dfa.add_transition(dfa.start_state, "c", dfa.start_state)
+    assert not regex_to_dfa("a* b").accepts(["c", "b"])
+
+    # a tab is part of the symbol, not a separator
+    assert regex_to_dfa("a b").accepts(["a", "b"])
+    assert regex_to_dfa("a\tb").accepts(["a\tb"])
+
+
+def test_bit_matrix_matches_sparse():
+    a = scipy.sparse.random(70, 130, 0.1, format="csr", random_state=1) > 0
+    b = scipy.sparse.random(130, 65, 0.1, format="csr", random_state=2) > 0
+    bits_a, bits_b = BitMatrix(a), BitMatrix(b)
+
+    assert ((bits_a @ bits_b).toarray() == (a @ b).toarray()).all()
+    assert ((bits_a @ b).toarray() == (a @ b).toarray()).all()
+    vector = np.arange(130) % 7 == 0
+    assert ((bits_a @ vector) == (a @ vector)).all()
+    assert (bits_a.T.toarray() == a.T.toarray()).all()
+    assert bits_b.T.shape == (65, 130)
+    assert (bits_b.T.T.words == bits_b.words).all()
+    assert bits_a.nnz == a.nnz
+    assert set(zip(*bits_a.nonzero())) == set(zip(*a.nonzero()))
+    assert (
+        bits_a[[1, 3]][:, [0, 64, 129]].toarray() == a[[1, 3]][:, [0, 64, 129]]
+    ).all()
+    assert ((bits_a > a) + (bits_a != a)).nnz == 0
@@ -1,5 +1,25 @@
+import numpy as np
+import project.task3
 from networkx import MultiDiGraph
-from project.task3 import paths_ends
+from pyformlang.finite_automaton import State
+from scipy.sparse import dok_matrix
+from project.task1 import create_two_cycles_graph
+from pyformlang.regular_expression import Regex
+from project.bitmatrix import BitMatrix
+from project.task2 import GraphMatrices, graph_to_nfa, regex_to_dfa
+from project.task3 import (
+    CompactAutomaton,
+    FiniteAutomaton,
+    compile_regex,
+    graph_to_mat,
+    intersect_automata,
+    mat_to_nfa,
+    nfa_to_mat,
+    paths_ends,
+    reachable_from,
+    regex_to_mat,
+    transitive_closure,
+)
 
 
 def test_paths_ends_empty_graph():
@@ -17,3 +37,224 @@ def test_paths_ends_no_matching_paths():
 
     result = paths_ends(g, {0}, {1}, "a")
     assert result == []
+
+
+def test_dfa_labels_are_transition_symbols():
+    dfa = FiniteAutomaton(regex_to_dfa("a b*"))
+    assert set(dfa.labels()) == {"a", "b"}
+
+
+def test_regex_to_mat_copies_are_independent():
+    automaton = regex_to_mat("a b*")
+    automaton.transitions["zzz"] = automaton.transitions["a"]
+    automaton.start_states.add(State(100))
+    automaton.final_states.clear()
+
+    fresh = regex_to_mat("a b*")
+    assert set(fresh.labels()) == {"a", "b"}
+    assert State(100) not in fresh.start_states
+    assert fresh.accepts(["a", "b"])
+
+
+def test_paths_ends_reports_empty_paths():
+    graph = create_two_cycles_graph(2, 2, ("a", "b"))
+
+    assert set(paths_ends(graph, {1}, set(), "b*")) == {(1, 1)}
+    assert set(paths_ends(graph, {0}, {1}, "a")) == {(0, 1)}
+
+
+def test_transitive_closure_chain():
+    n = 6
+    mat = dok_matrix((n, n), dtype=bool)
+    for i in range(n - 1):
+        mat[i, i + 1] = True
+    closure = transitive_closure(FiniteAutomaton({"a": mat}))
+
+    expected = {(i, j) for i in range(n) for j in range(i + 1, n)}
+    assert set(zip(*closure.nonzero())) == expected
+
+
+def test_graph_to_mat_matches_nfa_to_mat():
+    graph = create_two_cycles_graph(3, 4, ("a", "b"))
+    direct = graph_to_mat(graph, {0}, {1, 2})
+    via_nfa = nfa_to_mat(graph_to_nfa(graph, {0}, {1, 2}))
+
+    def edges(fa):
+        names = fa.indices_dict()
+        return {
+            (label, names[u], names[v])
+            for label, mat in fa.transitions.items()
+            for u, v in zip(*mat.nonzero())
+        }
+
+    assert edges(direct) == edges(via_nfa)
+    assert direct.start_states == via_nfa.start_states
+    assert direct.final_states == via_nfa.final_states
+
+
+def test_paths_ends_strategies_agree():
+    graph = create_two_cycles_graph(4, 3, ("a", "b"))
+    results = dict()
+    for strategy in ("bfs", "closure", "auto"):
+        stats = dict()
+        results[strategy] = set(
+            paths_ends(graph, {0, 1}, {0, 5}, "a* b", strategy=strategy, stats=stats)
+        )
+        assert stats["strategy"] in ("bfs", "closure")
+
+    assert results["bfs"] == results["closure"] == results["auto"]
+    assert results["bfs"] == {(0, 5), (1, 5)}
+
+
+def test_paths_ends_bfs_ratio(monkeypatch):
+    graph = create_two_cycles_graph(4, 3, ("a", "b"))
+    stats = dict()
+    paths_ends(graph, {0, 1}, set(), "a* b", bfs_ratio=0.1, stats=stats)
+    assert stats["strategy"] == "closure"
+    paths_ends(graph, {0, 1}, set(), "a* b", bfs_ratio=0.5, stats=stats)
+    assert stats["strategy"] == "bfs"
+
+    # default is read on every call
+    monkeypatch.setattr(project.task3, "BFS_START_RATIO", 0.1)
+    paths_ends(graph, {0, 1}, set(), "a* b", stats=stats)
+    assert stats["strategy"] == "closure"
+
+
+def test_lazy_intersection_matches_kron():
+    graph = create_two_cycles_graph(3, 2, ("a", "b"))
+    graph_fa = graph_to_mat(graph, {0, 2}, set())
+    regex_fa = FiniteAutomaton(regex_to_dfa("a* b"))
+    eager = intersect_automata(graph_fa, regex_fa)
+    lazy = intersect_automata(graph_fa, regex_fa, lazy=True)
+
+    assert (lazy.start_mask() == eager.start_mask()).all()
+    assert (lazy.final_mask() == eager.final_mask()).all()
+    sources = eager.start_indices()
+    assert (reachable_from(lazy, sources) != reachable_from(eager, sources)).nnz == 0
+    assert (transitive_closure(lazy) != transitive_closure(eager)).nnz == 0
+    assert eager.start_states == {State(k) for k in lazy.start_indices().tolist()}
+    assert eager.final_states == {State(k) for k in lazy.final_indices().tolist()}
+
+
+def test_accepts_matches_nfa():
+    dfa = regex_to_dfa("(ab | c)* d")
+    fa = FiniteAutomaton(dfa)
+    words = [[], ["d"], ["a", "b", "d"], ["c", "a", "b", "c", "d"], ["a", "d"], ["e"]]
+
+    expected = [dfa.accepts(word) for word in words]
+    assert fa.accepts_many(words) == expected
+    assert [mat_to_nfa(fa).accepts(word) for word in words] == expected
+
+
+def test_accepts_batch_shared_prefixes():
+    fa = FiniteAutomaton(regex_to_dfa("a b* c"))
+    words = [["a"], ["a", "c"], ["a", "b", "c"], ["a", "b"], ["a", "c"], ["b", "c"]]
+
+    result = fa.accepts_batch(words)
+    assert result.dtype == bool
+    assert result.tolist() == [fa.accepts(word) for word in words]
+    assert result.tolist() == [False, True, True, False, True, False]
+    assert fa.accepts_batch([]).shape == (0,)
+
+
+def test_compile_regex_matches_pyformlang():
+    regexes = [
+        "a b* c | d",
+        "(a|b)* c",
+        "a**",
+        "$",
+        "a . b + c",
+        "(a b d) | (a b c)",
+        "((a|b)*c)*((d | e)*f)*",
+        "a* a*",
+        "label_1 (label_2 | label_3)*",
+        "a\\ b",
+        "a|",
+        "(a|)",
+        "a+",
+    ]
+    for regex in regexes:
+        glushkov = compile_regex(regex)
+        minimal = compile_regex(regex, minimize=True)
+        expected = Regex(regex).to_epsilon_nfa()
+
+        assert mat_to_nfa(glushkov).is_equivalent_to(expected)
+        assert mat_to_nfa(minimal).is_equivalent_to(expected)
+        assert minimal.size() == len(regex_to_dfa(regex).states)
+
+    assert set(compile_regex("a\\ b").labels()) == {"a\\ ", "b"}
+
+
+def test_compact_automaton_round_trip():
+    graph = create_two_cycles_graph(3, 2, ("a", "b"))
+    automaton = graph_to_mat(graph, {0, 1}, {4})
+    compact = CompactAutomaton.from_automaton(automaton)
+
+    assert not hasattr(compact, "__dict__")
+    assert compact.labels.tolist() == ["a", "b"]
+    assert compact.matrix("c") is None
+    assert (compact.matrix("a") != automaton.transitions["a"]).nnz == 0
+
+    restored = FiniteAutomaton(compact)
+    assert restored.start_states == automaton.start_states
+    assert restored.final_states == automaton.final_states
+    assert restored.states_mapping == automaton.states_mapping
+    words = [["a", "b", "b"], ["b", "b"], ["a", "a", "a", "b", "b"]]
+    assert restored.accepts_many(words) == automaton.accepts_many(words)
+
+
+def test_automaton_save_load(tmp_path):
+    graph = create_two_cycles_graph(3, 2, ("a", "b"))
+    automaton = graph_to_mat(graph, {0, 1}, {4})
+    automaton.save(tmp_path / "automaton")
+    loaded = FiniteAutomaton.load(tmp_path / "automaton")
+    # neither side builds State objects until they are asked for
+    assert automaton._nodes is not None and loaded._nodes is not None
+
+    # CSR arrays are views of the memory-mapped files
+    base = loaded.transitions["a"].indices
+    while base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    assert base is not None
+    assert loaded.start_states == automaton.start_states
+    assert loaded.final_states == automaton.final_states
+    assert loaded.states_mapping == automaton.states_mapping
+    for label, mat in automaton.transitions.items():
+        assert (loaded.transitions[label] != mat).nnz == 0
+
+
+def test_transitive_closure_switches_to_bit_matrix():
+    n = 40
+    mat = dok_matrix((n, n), dtype=bool)
+    for i in range(n):
+        mat[i, (i + 1) % n] = True
+    automaton = FiniteAutomaton({"a": mat})
+
+    sparse = transitive_closure(automaton, dense_threshold=1.0)
+    dense = transitive_closure(automaton)
+    assert isinstance(dense, BitMatrix)
+    assert set(zip(*dense.nonzero())) == set(zip(*sparse.nonzero()))
+
+    graph = create_two_cycles_graph(4, 3, ("a", "b"))
+    for strategy in ("bfs", "closure"):
+        assert set(
+            paths_ends(graph, {0, 1}, set(), "a* b", BitMatrix, strategy=strategy)
+        ) == set(paths_ends(graph, {0, 1}, set(), "a* b", strategy=strategy))
+
+    # BitMatrix automata keep BitMatrix products and simulate words
+    bits = graph_to_mat(graph, {0, 1}, set(), BitMatrix)
+    product = intersect_automata(bits, regex_to_mat("a* b", BitMatrix), lazy=True)
+    assert all(isinstance(mat, BitMatrix) for mat in product.matrices().values())
+    sparse_fa = graph_to_mat(graph, {0, 1}, set())
+    for word in (["a", "b"], ["b", "b", "b"], ["a"] * 9):
+        assert bits.accepts(word) == sparse_fa.accepts(word)
+
+
+def test_graph_to_mat_uses_graph_indices():
+    graph = GraphMatrices.from_networkx(create_two_cycles_graph(3, 4, ("a", "b")))
+    fa = graph_to_mat(graph, {2, 0, 100}, set())
+
+    assert fa.start_indices().tolist() == sorted(graph.indices({0, 2}).tolist())
+    assert fa.final_mask().all() and fa.size() == graph.size()
+    assert fa.start_states == {State(0), State(2)}
+    assert fa.states_mapping == {State(v): i for v, i in graph.index().items()}
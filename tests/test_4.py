@@ -0,0 +1,51 @@
+from networkx import MultiDiGraph
+from scipy.sparse import csc_matrix, dok_matrix, lil_matrix
+from project.bitmatrix import BitMatrix
+from project.task1 import create_two_cycles_graph
+from project.task2 import regex_to_dfa
+from project.task3 import FiniteAutomaton, graph_to_mat, regex_to_mat
+from project.task4 import reachability_with_constraints
+
+
+def test_reachability_follows_constraint():
+    graph = graph_to_mat(create_two_cycles_graph(2, 2, ("a", "b")), {0, 1}, set())
+
+    assert reachability_with_constraints(
+        graph, FiniteAutomaton(regex_to_dfa("a a"))
+    ) == {0: {2}, 1: {0}}
+    assert reachability_with_constraints(
+        graph, FiniteAutomaton(regex_to_dfa("a*"))
+    ) == {0: {0, 1, 2}, 1: {0, 1, 2}}
+    # graph nodes are read from the node array, no State objects are built
+    assert graph._nodes is not None
+
+
+def test_chain_stops_when_front_is_empty():
+    n = 50
+    g = MultiDiGraph()
+    for i in range(n - 1):
+        g.add_edge(i, i + 1, label="a")
+
+    stats = dict()
+    result = reachability_with_constraints(
+        graph_to_mat(g, {0}, set()), FiniteAutomaton(regex_to_dfa("a*")), stats
+    )
+
+    assert result == {0: set(range(n))}
+    assert stats["iterations"] == n
+    assert stats["front_sizes"] == [1] * n + [0]
+
+
+def test_reachability_in_every_matrix_format():
+    graph = create_two_cycles_graph(3, 2, ("a", "b"))
+    expected = reachability_with_constraints(
+        graph_to_mat(graph, {0, 1}, set()), regex_to_mat("a* b")
+    )
+    for matrix_class in (csc_matrix, dok_matrix, lil_matrix, BitMatrix):
+        assert (
+            reachability_with_constraints(
+                graph_to_mat(graph, {0, 1}, set(), matrix_class),
+                regex_to_mat("a* b", matrix_class),
+            )
+            == expected
+        )
@@ -0,0 +1,43 @@
+import cfpq_data
+
+from project.task1 import create_two_cycles_graph
+from project.task5 import COST_MODEL, calibrate, rpq
+
+
+def test_rpq_plans_agree(tmp_path):
+    graph = create_two_cycles_graph(4, 3, ("a", "b"))
+    log_path = tmp_path / "queries.jsonl"
+    results = dict()
+    for plan in ("closure", "bfs", "reachability"):
+        results[plan] = rpq(graph, {0, 1}, {0, 5}, "a* b", plan=plan, log_path=log_path)
+
+    assert results["closure"] == results["bfs"] == results["reachability"]
+    assert results["bfs"] == {(0, 5), (1, 5)}
+
+    stats = dict()
+    assert rpq(graph, {0}, set(), "a* b", stats=stats) == {(0, 5)}
+    assert stats["plan"] == min(stats["estimates"], key=stats["estimates"].get)
+    assert rpq(graph, set(), set(), "a* b", stats=stats)
+    assert stats["plan"] == "closure"
+
+    cost_model = calibrate(log_path)
+    assert set(cost_model) == set(COST_MODEL)
+    for plan, terms in cost_model.items():
+        assert set(terms) == set(COST_MODEL[plan])
+        assert all(value >= 0 for value in terms.values())
+
+
+def test_rpq_every_plan_wins():
+    cycles = create_two_cycles_graph(100, 50, ("a", "b"))
+    binomial = cfpq_data.labeled_binomial_graph(200, 0.02, labels=["a", "b"], seed=1)
+    sparse = cfpq_data.labeled_binomial_graph(2000, 0.002, labels=["a", "b"], seed=1)
+    queries = {
+        "closure": (cycles, set(), "a* b*"),
+        "reachability": (sparse, {0}, "a b* a"),
+        "bfs": (binomial, set(range(100)), "a b* a"),
+    }
+    for plan, (graph, start_nodes, regex) in queries.items():
+        stats = dict()
+        result = rpq(graph, start_nodes, set(), regex, stats=stats)
+        assert stats["plan"] == plan
+        assert result == rpq(graph, start_nodes, set(), regex, plan="bfs")
@@ -0,0 +1,56 @@
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG
+import project.task6
+from project.task6 import GrammarCache, cfg_to_weak_normal_form, cfpq_with_hellings
+
+
+def test_cfpq_with_hellings_nested_words():
+    graph = MultiDiGraph()
+    for i, label in enumerate("aabb"):
+        graph.add_edge(i, i + 1, label=label)
+
+    assert cfpq_with_hellings(CFG.from_text("S -> a S b | $"), graph) == {
+        (v, v) for v in range(5)
+    } | {(1, 3), (0, 4)}
+
+
+def test_cfpq_with_hellings_joins_late_left_parts():
+    # A on the left of S -> A B is derived after most B edges were processed
+    graph = MultiDiGraph()
+    for k in range(20):
+        for i, label in enumerate("aab"):
+            graph.add_edge(4 * k + i, 4 * k + i + 1, label=label)
+    cfg = CFG.from_text("S -> A B\nA -> C C\nC -> a\nB -> b")
+
+    assert cfpq_with_hellings(cfg, graph) == {(4 * k, 4 * k + 3) for k in range(20)}
+
+
+def test_cfpq_with_hellings_small_chunks(monkeypatch):
+    graph = MultiDiGraph()
+    for i in range(12):
+        graph.add_edge(i, (i + 1) % 12, label="a")
+    cfg = CFG.from_text("S -> S S | a")
+    expected = {(v, u) for v in range(12) for u in range(12)}
+
+    assert cfpq_with_hellings(cfg, graph) == expected
+    monkeypatch.setattr(project.task6, "COMPOSE_CHUNK", 5)
+    assert cfpq_with_hellings(cfg, graph) == expected
+
+
+def test_grammar_cache(tmp_path):
+    cache = GrammarCache(maxsize=1, cache_dir=tmp_path)
+    first = cache.get(CFG.from_text("S -> a S b | a b"))
+    assert cache.get(CFG.from_text("S -> a b\nS -> a S b")) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert (
+        first.cfg.productions
+        == cfg_to_weak_normal_form(CFG.from_text("S -> a S b | a b")).productions
+    )
+
+    cache.get(CFG.from_text("S -> b"))
+    assert len(cache) == 1
+    # evicted entry comes back from the persistent tier
+    reloaded = cache.get(CFG.from_text("S -> a S b | a b"))
+    assert reloaded is not first
+    assert reloaded.extracted == first.extracted
+    assert len(list(tmp_path.iterdir())) == 2
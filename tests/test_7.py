@@ -0,0 +1,28 @@
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG
+from project.task7 import cfpq_with_matrix
+
+
+def test_cfpq_with_matrix_nested_words():
+    graph = MultiDiGraph()
+    for i, label in enumerate("aabb"):
+        graph.add_edge(i, i + 1, label=label)
+
+    assert cfpq_with_matrix(CFG.from_text("S -> a S b | $"), graph) == {
+        (v, v) for v in range(5)
+    } | {(1, 3), (0, 4)}
+
+
+def test_cfpq_with_matrix_stops_on_empty_delta():
+    n = 6
+    graph = MultiDiGraph()
+    for i in range(n):
+        graph.add_edge(i, i + 1, label="a")
+        graph.add_edge(n + i, n + i + 1, label="b")
+    stats = dict()
+    result = cfpq_with_matrix(CFG.from_text("S -> a S b | a b"), graph, stats=stats)
+
+    assert result == {(n - k, n + k) for k in range(1, n + 1)}
+    # every nesting level takes two rounds (C -> S b, then S -> a C), the
+    # last round finds nothing new
+    assert stats["iterations"] == 2 * n
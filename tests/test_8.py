@@ -0,0 +1,16 @@
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG
+from project.task8 import cfg_to_rsm, cfpq_with_tensor
+
+
+def test_cfpq_with_tensor_nested_words():
+    graph = MultiDiGraph()
+    for i, label in enumerate("aabb"):
+        graph.add_edge(i, i + 1, label=label)
+    rsm = cfg_to_rsm(CFG.from_text("S -> a S b | $"))
+
+    assert cfpq_with_tensor(rsm, graph) == {(v, v) for v in range(5)} | {
+        (1, 3),
+        (0, 4),
+    }
+    assert cfpq_with_tensor(rsm, graph, {0}, {3, 4}) == {(0, 4)}
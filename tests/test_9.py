@@ -0,0 +1,16 @@
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG
+from project.task9 import cfpq_with_gll
+
+
+def test_cfpq_with_gll_nested_words():
+    graph = MultiDiGraph()
+    for i, label in enumerate("aabb"):
+        graph.add_edge(i, i + 1, label=label)
+    cfg = CFG.from_text("S -> a S b | $")
+
+    assert cfpq_with_gll(cfg, graph) == {(v, v) for v in range(5)} | {
+        (1, 3),
+        (0, 4),
+    }
+    assert cfpq_with_gll(cfg, graph, {0}, {3, 4}) == {(0, 4)}